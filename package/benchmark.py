@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+import logging
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import numpy as np # type: ignore
+from PIL import Image, ImageDraw # type: ignore
+
+from typing import Callable, List, Dict, Optional, Tuple
+
+from site_location import (SiteLocationGame, SiteLocationMap,
+                           SiteLocationPlayer, Store, DEFAULT_CONFIGURATION,
+                           AttractivenessAllocationEngine,
+                           attractiveness_allocation, attractiveness_revenue,
+                           closest_store_allocation, evaluate_store_candidates,
+                           manhatten_distance_transform, log)
+from perlin_numpy import (generate_perlin_noise_2d,
+                          generate_perlin_noise_2d_chunked)
+import example_players
+
+
+MAP_SIZES = [100, 400, 1000, 4000]
+PLAYER_COUNTS = [2, 4, 6]
+STORES_PER_PLAYER = [1, 10, 50, 200]
+
+# Reference checks are skipped when the reference implementation would have
+# to evaluate more than this many (grid cell, store) pairs
+CHECK_LIMIT = 5e8
+# Full games are only played up to this map size, as every round keeps one
+# allocation grid per player
+MAX_PLAY_SIZE = 1000
+N_CANDIDATES = 100
+N_CHECKED_CANDIDATES = 3
+
+
+# Reference implementations: the straightforward full grid versions of the
+# game functions, which the optimized code must reproduce
+
+def reference_distances(size, point, metric: str) -> np.ndarray:
+    x = np.linspace(0, size[0], size[0])
+    y = np.linspace(0, size[1], size[1])
+    if metric == "manhatten":
+        return abs(x[:, None] - point[0]) + abs(y[None, :] - point[1])
+    return np.sqrt(np.square(x[:, None] - point[0])
+                   + np.square(y[None, :] - point[1]))
+
+
+def reference_attractiveness_allocation(slmap: SiteLocationMap,
+                                        stores: Dict[int, List[Store]],
+                                        store_config: Dict[str, Dict[str, float]]
+                                        ) -> Dict[int, np.ndarray]:
+    attractiveness_by_player = {}
+    total_attractiveness = np.zeros(slmap.size)
+    for player_id in stores:
+        best_attractiveness = np.zeros(slmap.size)
+        for store in stores[player_id]:
+            distances = reference_distances(slmap.size, store.pos, "euclidian")
+            attractiveness = \
+                store_config[store.store_type]["attractiveness"] \
+                / np.maximum(distances, np.ones(distances.shape)) \
+                - store_config[store.store_type]["attractiveness_constant"]
+            attractiveness = np.where(attractiveness < 0, 0, attractiveness)
+            best_attractiveness = np.maximum(best_attractiveness, attractiveness)
+        attractiveness_by_player[player_id] = best_attractiveness
+        total_attractiveness += best_attractiveness
+    total_attractiveness = np.where(total_attractiveness == 0,
+                                    1, total_attractiveness)
+    return {player_id: attractiveness_by_player[player_id] / total_attractiveness
+            for player_id in stores}
+
+
+def reference_closest_store_allocation(slmap: SiteLocationMap,
+                                       stores: Dict[int, List[Store]],
+                                       max_dist=50) -> Dict[int, np.ndarray]:
+    distances_by_player = {}
+    global_min = None
+    for player_id, player_stores in stores.items():
+        least_distance = np.full(slmap.size, np.inf)
+        for store in player_stores:
+            least_distance = np.minimum(
+                least_distance,
+                reference_distances(slmap.size, store.pos, "manhatten"))
+        distances_by_player[player_id] = least_distance
+        if global_min is None:
+            global_min = least_distance
+        else:
+            global_min = np.minimum(least_distance, global_min)
+    return {player_id: ((least_distance <= global_min)
+                        & (least_distance <= max_dist)).astype(float)
+            for player_id, least_distance in distances_by_player.items()}
+
+
+def reference_round_score(slmap: SiteLocationMap,
+                          allocations: Dict[int, np.ndarray],
+                          profit_per_customer: float) -> Dict[int, float]:
+    return {player_id: np.sum(slmap.population_distribution * allocation)
+            * profit_per_customer
+            for player_id, allocation in allocations.items()}
+
+
+def reference_blend_rgba(datas):
+    blended = np.zeros(datas[0].shape).astype(float)
+
+    total_alpha = np.zeros(datas[0].shape[:2])
+    for data in datas:
+        data = data.astype(float) / 255.0
+        total_alpha += data[:,:,3]
+        total_alpha = np.where(total_alpha == 0, 1, total_alpha)
+
+    for data in datas:
+        data = data.astype(float) / 255.0
+        blended[:,:,:3] += (np.square(data[:,:,:3]) * data[:,:,3][:,:,None] / total_alpha[:,:,None]) / len(datas)
+        blended[:,:,3] += data[:,:,3] / len(datas)
+
+    blended[:,:,:3] = np.sqrt(blended[:,:,:3])
+    return (blended * 255.0).astype(np.uint8)
+
+
+def reference_render_image(slmap: SiteLocationMap,
+                           colors: Dict[int, Tuple[int, int, int]],
+                           stores: Dict[int, List[Store]],
+                           allocations: Dict[int, np.ndarray]) -> Image.Image:
+    shape = slmap.population_distribution.shape
+    data = np.zeros((shape[0], shape[1], 4), dtype=np.uint8)
+
+    pop_norm = slmap.population_distribution * (
+        255.0 / slmap.population_distribution.max())
+    data[:,:,0] += pop_norm.astype(np.uint8)
+    data[:,:,1] += pop_norm.astype(np.uint8)
+    data[:,:,2] += pop_norm.astype(np.uint8)
+    data[:,:,3] = 255
+    image = Image.fromarray(data, 'RGBA')
+
+    draw = ImageDraw.Draw(image)
+    allocation_images = []
+    for player_id, color in colors.items():
+        for store in stores[player_id]:
+            pointsize = 3
+            draw.ellipse((store.pos[1]-pointsize,
+                          store.pos[0]-pointsize,
+                          store.pos[1]+pointsize,
+                          store.pos[0]+pointsize),
+                         color)
+        al_data = np.zeros((shape[0], shape[1], 4), dtype=np.uint8)
+        al_data[:,:,:3] = color
+        al_data[:,:,3] = (allocations[player_id] * 255.0).astype(np.uint8)
+        allocation_images.append(al_data)
+
+    blended = reference_blend_rgba(allocation_images)
+    blended[:,:,3] = pop_norm[:,:] * 2 / 255.0 * blended[:,:,3]
+    image.paste(Image.fromarray(blended), (0, 0), Image.fromarray(blended))
+    return image
+
+
+class IdlePlayer(SiteLocationPlayer):
+    """
+    Player that never places a store, used to set up games whose stores are
+    chosen by the benchmark.
+    """
+    def place_stores(self, slmap: SiteLocationMap,
+                     store_locations: Dict[int, List[Store]],
+                     current_funds: float):
+        self.stores_to_place = []
+
+
+def measure(func: Callable, repeat: int = 1):
+    """ Returns the result of func() and a dict with the best wall time of
+    repeat calls and the peak memory traced during one more call.
+    """
+    seconds = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start_time)
+        del result
+
+    tracemalloc.start()
+    try:
+        result = func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": min(seconds), "peak_mb": peak_bytes / 2**20}
+
+
+def compare(result, reference, tolerance: float = 0.0) -> Dict:
+    """ Compare result against reference, a dict of arrays (or numbers) by
+    player id, an array or an image. Returns the largest absolute difference
+    and whether it is within tolerance.
+    """
+    if isinstance(reference, dict):
+        if sorted(result) != sorted(reference):
+            return {"max_abs_diff": None, "equivalent": False}
+        pairs = [(result[key], reference[key]) for key in reference]
+    else:
+        pairs = [(result, reference)]
+
+    max_abs_diff = 0.0
+    for value, expected in pairs:
+        value = np.asarray(value, dtype=float)
+        expected = np.asarray(expected, dtype=float)
+        if value.shape != expected.shape:
+            return {"max_abs_diff": None, "equivalent": False}
+        if value.size:
+            max_abs_diff = max(max_abs_diff,
+                               float(np.max(np.abs(value - expected))))
+    return {"max_abs_diff": max_abs_diff,
+            "equivalent": bool(max_abs_diff <= tolerance)}
+
+
+def random_stores(size, n_players: int, n_stores: int,
+                  store_types: List[str],
+                  rng: random.Random) -> Dict[int, List[Store]]:
+    return {player_id: [Store((rng.randrange(size[0]), rng.randrange(size[1])),
+                              rng.choice(store_types))
+                        for i in range(n_stores)]
+            for player_id in range(n_players)}
+
+
+def benchmark_map(size: int, seed: int, repeat: int) -> List[Dict]:
+    """ Time population map generation and the perlin noise behind it
+    """
+    shape = (size, size)
+    res = (4, 4)
+    rows = []
+
+    _, stats = measure(lambda: SiteLocationMap(shape, seed=seed), repeat)
+    rows.append(dict(phase="map", size=size, **stats))
+
+    chunked, stats = measure(lambda: generate_perlin_noise_2d_chunked(
+        shape, res, rng=np.random.default_rng(seed)), repeat)
+    row = dict(phase="perlin_chunked", size=size, **stats)
+    if size % res[0] == 0 and size % res[1] == 0:
+        reference, stats = measure(lambda: generate_perlin_noise_2d(
+            shape, res, rng=np.random.default_rng(seed)), repeat)
+        rows.append(dict(phase="perlin", size=size, **stats))
+        # The chunks interpolate in a different order, so allow for rounding
+        row.update(compare(chunked, reference, tolerance=1e-12))
+    rows.append(row)
+    return rows
+
+
+def benchmark_case(size: int, n_players: int, n_stores: int,
+                   seed: int, repeat: int,
+                   check_limit: float = CHECK_LIMIT) -> List[Dict]:
+    """ Time the allocation functions, round_score, candidate evaluation and
+    rendering for n_players players with n_stores random stores each, and
+    check their results against the reference implementations.
+    """
+    config = dict(DEFAULT_CONFIGURATION, map_size=(size, size), map_seed=seed)
+    store_config = config["store_config"]
+    game = SiteLocationGame(config, [IdlePlayer]*n_players,
+                            attractiveness_allocation)
+    slmap = game.slmaps[0]
+    rng = random.Random(seed)
+    stores = random_stores(slmap.size, n_players, n_stores,
+                           list(store_config), rng)
+    players = dict(game.players)
+    colors = {player_id: player.color for player_id, player in players.items()}
+    check = size * size * n_players * n_stores <= check_limit
+    case = dict(size=size, players=n_players, stores_per_player=n_stores)
+    rows = []
+
+    allocations, stats = measure(
+        lambda: attractiveness_allocation(slmap, stores, store_config), repeat)
+    row = dict(phase="attractiveness_allocation", **case, **stats)
+    if check:
+        row.update(compare(allocations, reference_attractiveness_allocation(
+            slmap, stores, store_config)))
+    rows.append(row)
+
+    def engine_allocation():
+        # Fold the stores in two increments, as rounds of a game would
+        engine = AttractivenessAllocationEngine(slmap, store_config)
+        engine.update({player_id: player_stores[:len(player_stores) // 2]
+                       for player_id, player_stores in stores.items()})
+        engine.update(stores)
+        return engine.allocations()
+
+    engine_allocations, stats = measure(engine_allocation, repeat)
+    row = dict(phase="engine_allocation", **case, **stats)
+    if check:
+        row.update(compare(engine_allocations,
+                           reference_attractiveness_allocation(
+                               slmap, stores, store_config)))
+    rows.append(row)
+    del engine_allocations
+
+    revenues, stats = measure(lambda: attractiveness_revenue(
+        slmap, stores, store_config, config["profit_per_customer"]), repeat)
+    row = dict(phase="attractiveness_revenue", **case, **stats)
+    if check:
+        expected = reference_round_score(
+            slmap,
+            reference_attractiveness_allocation(slmap, stores, store_config),
+            config["profit_per_customer"])
+        row.update(compare(revenues, expected))
+    rows.append(row)
+
+    points = [store.pos for player_stores in stores.values()
+              for store in player_stores]
+    (distances, labels), stats = measure(
+        lambda: manhatten_distance_transform(slmap.size, points), repeat)
+    row = dict(phase="manhatten_distance_transform", **case, **stats)
+    if check:
+        expected = np.full(slmap.size, np.inf)
+        for point in points:
+            expected = np.minimum(
+                expected, reference_distances(slmap.size, point, "manhatten"))
+        # The distance to the labelled point can differ from the minimum in
+        # the last bit where points are (nearly) tied
+        row.update(compare(distances, expected,
+                           tolerance=1e-12 * size))
+    rows.append(row)
+    del distances, labels
+
+    closest, stats = measure(
+        lambda: closest_store_allocation(slmap, players, stores), repeat)
+    row = dict(phase="closest_store_allocation", **case, **stats)
+    if check:
+        row.update(compare(closest,
+                           reference_closest_store_allocation(slmap, stores)))
+    rows.append(row)
+    del closest
+
+    game.store_locations.append(stores)
+    game.allocations.append(allocations)
+    scores, stats = measure(game.round_score, repeat)
+    row = dict(phase="round_score", **case, **stats)
+    row.update(compare(scores, reference_round_score(
+        slmap, allocations, config["profit_per_customer"])))
+    rows.append(row)
+
+    candidates = [(rng.randrange(size), rng.randrange(size))
+                  for i in range(N_CANDIDATES)]
+    gains, stats = measure(lambda: evaluate_store_candidates(
+        slmap, stores, store_config, 0, "large", candidates), repeat)
+    row = dict(phase="evaluate_store_candidates", candidates=N_CANDIDATES,
+               **case, **stats)
+    if check:
+        expected = []
+        for candidate in candidates[:N_CHECKED_CANDIDATES]:
+            candidate_stores = dict(stores)
+            candidate_stores[0] = stores[0] + [Store(candidate, "large")]
+            allocation = reference_attractiveness_allocation(
+                slmap, candidate_stores, store_config)[0]
+            expected.append(np.sum(allocation * slmap.population_distribution))
+        # Gains are summed in a different order, so allow for rounding
+        row.update(compare(gains[:N_CHECKED_CANDIDATES], expected,
+                           tolerance=1e-10 * max(expected)))
+    rows.append(row)
+
+    image, stats = measure(
+        lambda: slmap.render_image(colors, stores, allocations), repeat)
+    row = dict(phase="render", **case, **stats)
+    # Blending is done in float32, which can be off by one intensity level,
+    # and the population scaled alpha can double that in the final image
+    row.update(compare(np.asarray(image, dtype=np.int16),
+                       np.asarray(reference_render_image(slmap, colors, stores,
+                                                         allocations),
+                                  dtype=np.int16),
+                       tolerance=2))
+    rows.append(row)
+    return rows
+
+
+def benchmark_play(size: int, n_players: int, n_rounds: int,
+                   seed: int, check_limit: float = CHECK_LIMIT) -> Dict:
+    """ Time a full game between RandomPlayers, and check the revenue of the
+    last round against the reference implementations for the final stores.
+    """
+    config = dict(DEFAULT_CONFIGURATION, map_size=(size, size),
+                  map_seed=seed, n_rounds=n_rounds)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    def play():
+        game = SiteLocationGame(config,
+                                [example_players.RandomPlayer]*n_players,
+                                attractiveness_allocation)
+        game.play()
+        return game
+
+    game, stats = measure(play)
+    row = dict(phase="play", size=size, players=n_players, rounds=n_rounds,
+               **stats)
+    stores = game.store_locations[-1]
+    n_stores = sum(len(player_stores) for player_stores in stores.values())
+    if size * size * n_stores <= check_limit:
+        slmap = game.slmaps[-1]
+        expected = reference_round_score(
+            slmap,
+            reference_attractiveness_allocation(slmap, stores,
+                                                config["store_config"]),
+            config["profit_per_customer"])
+        row.update(compare(game.round_score(), expected))
+    return row
+
+
+def run_benchmarks(sizes: List[int] = MAP_SIZES,
+                   player_counts: List[int] = PLAYER_COUNTS,
+                   stores_per_player: List[int] = STORES_PER_PLAYER,
+                   n_rounds: int = 10,
+                   seed: int = 0,
+                   repeat: int = 3,
+                   check_limit: float = CHECK_LIMIT,
+                   max_play_size: int = MAX_PLAY_SIZE) -> Dict:
+    """ Run every benchmark over the given sweep, returns a json serializable
+    dict with the environment and one row per measurement.
+
+    Each row has the phase, the sweep parameters, the best time in seconds
+    and the peak traced memory in MB. Rows checked against a reference
+    implementation also have max_abs_diff and equivalent.
+    """
+    rows = []
+    for size in sizes:
+        log.info(f"Benchmarking {size}x{size} map")
+        rows.extend(benchmark_map(size, seed, repeat))
+        for n_players in player_counts:
+            for n_stores in stores_per_player:
+                log.info(f"Benchmarking {size}x{size} map, {n_players} players, {n_stores} stores each")
+                rows.extend(benchmark_case(size, n_players, n_stores, seed,
+                                           repeat, check_limit))
+            if size <= max_play_size:
+                log.info(f"Benchmarking {size}x{size} game, {n_players} players")
+                rows.append(benchmark_play(size, n_players, n_rounds, seed,
+                                           check_limit))
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Site Location Game benchmarks")
+    parser.add_argument("--sizes", nargs="+", type=int, default=MAP_SIZES,
+                        help="map sizes (square maps) to benchmark")
+    parser.add_argument("--players", nargs="+", type=int, default=PLAYER_COUNTS,
+                        help="player counts to benchmark")
+    parser.add_argument("--stores", nargs="+", type=int, default=STORES_PER_PLAYER,
+                        help="numbers of stores per player to benchmark")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="number of rounds of the full games")
+    parser.add_argument("--max-play-size", type=int, default=MAX_PLAY_SIZE,
+                        help="largest map size to play full games on")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of timed runs of each measurement, the best is reported")
+    parser.add_argument("--check-limit", type=float, default=CHECK_LIMIT,
+                        help="skip reference checks that would evaluate more (cell, store) pairs")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for the maps and stores")
+    parser.add_argument("--out", type=str, default="benchmark.json",
+                        help="json file to write the results to")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log the progress of the benchmarks")
+    args = parser.parse_args()
+
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+    results = run_benchmarks(args.sizes, args.players, args.stores,
+                             n_rounds=args.rounds,
+                             seed=args.seed,
+                             repeat=args.repeat,
+                             check_limit=args.check_limit,
+                             max_play_size=args.max_play_size)
+
+    failed = []
+    for row in results["results"]:
+        params = ", ".join(f"{key}={row[key]}"
+                           for key in ("size", "players", "stores_per_player",
+                                       "rounds")
+                           if key in row)
+        check = ""
+        if "equivalent" in row:
+            check = "  ok" if row["equivalent"] else "  MISMATCH"
+            if not row["equivalent"]:
+                failed.append(row)
+        print(f"{row['phase']:<28} {params:<45} {row['seconds']:9.4f}s "
+              f"{row['peak_mb']:9.1f}MB{check}")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if failed:
+        print(f"{len(failed)} result(s) differ from the reference implementation")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,8 @@
 import random
 import numpy as np
 from typing import List, Dict, Optional, Tuple
-import copy
 
-from site_location import SiteLocationPlayer, Store, SiteLocationMap, euclidian_distances, attractiveness_allocation
+from site_location import SiteLocationPlayer, Store, SiteLocationMap, euclidian_distances, AttractivenessAllocationEngine
 
 class RandomPlayer(SiteLocationPlayer):
     """
@@ -48,39 +47,38 @@ class MaxDensityPlayer(SiteLocationPlayer):
         else:
             store_type = 'small'
         # Find highest population location
-        all_stores_pos = []
-        for player, player_stores in store_locations.items():
-            for player_store in player_stores:
-                all_stores_pos.append(player_store.pos)
-        
-        sorted_indices = tuple(map(tuple, np.dstack(np.unravel_index(np.argsort(slmap.population_distribution.ravel()), slmap.size))[0][::-1]))
-        for max_pos in sorted_indices:
-            too_close = False
-            for pos in all_stores_pos:
-                dist = np.sqrt(np.square(max_pos[0]-pos[0]) + np.square(max_pos[1]-pos[1]))
-                if dist < min_dist:
-                    too_close = True
-            if not too_close:
-                self.stores_to_place = [Store(max_pos, store_type)]
+        cells = slmap.top_cells(1, min_dist,
+                                [store.pos for store in self.store_index.stores])
+        if len(cells) == 0:
+            self.stores_to_place = []
+            return
+        self.stores_to_place = [Store((int(cells[0][0]), int(cells[0][1])), store_type)]
 
 
 class CopycatPlayer(SiteLocationPlayer):
     """ 
     Player places an identical store at the location of a random opponent's store.
     """
+    def __init__(self, player_id: int, config: Dict):
+        super().__init__(player_id, config)
+        self.self_stores_pos = set()
+        self.opp_stores: Dict[int, List[Store]] = {}
+
+    def observe_stores(self, new_stores: Dict[int, List[Store]]):
+        for player, player_stores in new_stores.items():
+            if player == self.player_id:
+                self.self_stores_pos.update(store.pos for store in player_stores)
+            else:
+                self.opp_stores.setdefault(player, []).extend(player_stores)
+
     def place_stores(self, slmap: SiteLocationMap, 
                      store_locations: Dict[int, List[Store]],
                      current_funds: float):
 
-        self_stores_pos = []
-        for store in store_locations[self.player_id]:
-            self_stores_pos.append(store.pos)
-
-        opp_store_locations = {k:v for (k,v) in store_locations.items() if k != self.player_id}
         opp_all_stores = []
-        for player, player_stores in opp_store_locations.items():
+        for player, player_stores in self.opp_stores.items():
             for player_store in player_stores:
-                if player_store.pos not in self_stores_pos:
+                if player_store.pos not in self.self_stores_pos:
                     opp_all_stores.append(player_store)
         if not opp_all_stores:
             self.stores_to_place =  []
@@ -94,6 +92,14 @@ class AllocSamplePlayer(SiteLocationPlayer):
     Agent samples locations and selects the highest allocating one using
     the allocation function. 
     """
+    def __init__(self, player_id: int, config: Dict):
+        super().__init__(player_id, config)
+        self.engine: Optional[AttractivenessAllocationEngine] = None
+        self.new_stores: List[Dict[int, List[Store]]] = []
+
+    def observe_stores(self, new_stores: Dict[int, List[Store]]):
+        self.new_stores.append(new_stores)
+
     def place_stores(self, slmap: SiteLocationMap, 
                      store_locations: Dict[int, List[Store]],
                      current_funds: float):
@@ -102,8 +108,8 @@ class AllocSamplePlayer(SiteLocationPlayer):
 
         sample_pos = []
         for i in range(num_rand):
-            x = random.randint(0, slmap.size[0])
-            y = random.randint(0, slmap.size[1])
+            x = random.randrange(0, slmap.size[0])
+            y = random.randrange(0, slmap.size[1])
             sample_pos.append((x,y))
         # Choose largest store type possible:
         if current_funds >= store_conf['large']['capital_cost']:
@@ -113,19 +119,20 @@ class AllocSamplePlayer(SiteLocationPlayer):
         else:
             store_type = 'small'
 
-        best_score = 0
-        best_pos = []
-        for pos in sample_pos:
-            sample_store = Store(pos, store_type)
-            temp_store_locations = copy.deepcopy(store_locations)
-            temp_store_locations[self.player_id].append(sample_store)
-            sample_alloc = attractiveness_allocation(slmap, temp_store_locations, store_conf)
-            sample_score = (sample_alloc[self.player_id] * slmap.population_distribution).sum()
-            if sample_score > best_score:
-                best_score = sample_score
-                best_pos = [pos]
-            elif sample_score == best_score:
-                best_pos.append(pos)
+        # Only the stores placed since the last round are added to the
+        # attractiveness fields
+        if self.engine is None:
+            self.engine = AttractivenessAllocationEngine(slmap, store_conf)
+        for new_stores in self.new_stores:
+            for player, player_stores in new_stores.items():
+                self.engine.add_stores(player, player_stores)
+        self.new_stores = []
+
+        sample_scores = self.engine.evaluate_candidates(self.player_id,
+                                                        store_type, sample_pos)
+        best_score = sample_scores.max()
+        best_pos = [pos for pos, sample_score in zip(sample_pos, sample_scores)
+                    if sample_score == best_score]
 
         # max_alloc_positons = np.argwhere(alloc[self.player_id] == np.amax(alloc[self.player_id]))
         # pos = random.choice(max_alloc_positons)
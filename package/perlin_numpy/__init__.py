@@ -1,2 +1,4 @@
 from .perlin3d import generate_fractal_noise_3d, generate_perlin_noise_3d
 from .perlin2d import generate_perlin_noise_2d, generate_fractal_noise_2d
+from .perlin2d import generate_perlin_noise_2d_chunked
+from .perlin2d import generate_fractal_noise_2d_tiles, generate_fractal_noise_2d_memmap
@@ -6,7 +6,8 @@ def interpolant(t):
 
 
 def generate_perlin_noise_2d(
-        shape, res, tileable=(False, False), interpolant=interpolant
+        shape, res, tileable=(False, False), interpolant=interpolant,
+        rng=None
 ):
     """Generate a 2D numpy array of perlin noise.
 
@@ -20,6 +21,8 @@ def generate_perlin_noise_2d(
             (tuple of two bools). Defaults to (False, False).
         interpolant: The interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
 
     Returns:
         A numpy array of shape shape with the generated noise.
@@ -32,7 +35,9 @@ def generate_perlin_noise_2d(
     grid = np.mgrid[0:res[0]:delta[0], 0:res[1]:delta[1]]\
              .transpose(1, 2, 0) % 1
     # Gradients
-    angles = 2*np.pi*np.random.rand(res[0]+1, res[1]+1)
+    if rng is None:
+        rng = np.random
+    angles = 2*np.pi*rng.random((res[0]+1, res[1]+1))
     gradients = np.dstack((np.cos(angles), np.sin(angles)))
     if tileable[0]:
         gradients[-1,:] = gradients[0,:]
@@ -55,10 +60,93 @@ def generate_perlin_noise_2d(
     return np.sqrt(2)*((1-t[:,:,1])*n0 + t[:,:,1]*n1)
 
 
+def generate_perlin_noise_2d_chunked(
+        shape, res, tileable=(False, False), interpolant=interpolant,
+        rng=None, dtype=np.float64, chunk_size=2**20, out=None
+):
+    """Generate a 2D numpy array of perlin noise, a few rows at a time.
+
+    Produces the same noise as generate_perlin_noise_2d (for the same random
+    state), but only ever holds a chunk of about chunk_size values of each
+    intermediate array, and shape does not need to be a multiple of res.
+
+    Args:
+        shape: The shape of the generated array (tuple of two ints).
+        res: The number of periods of noise to generate along each
+            axis (tuple of two ints).
+        tileable: If the noise should be tileable along each axis
+            (tuple of two bools). Defaults to (False, False).
+        interpolant: The interpolation function, defaults to
+            t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
+        dtype: The dtype the noise is computed in. Defaults to float64.
+        chunk_size: The approximate number of values computed at once.
+        out: An optional array (e.g. a np.memmap) of shape shape to write
+            the noise into.
+
+    Returns:
+        A numpy array of shape shape with the generated noise.
+    """
+    gradients = _perlin_gradients_2d(res, tileable, rng, dtype)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    rows = max(1, chunk_size // max(shape[1], 1))
+    for start in range(0, shape[0], rows):
+        region = (slice(start, min(start + rows, shape[0])), slice(0, shape[1]))
+        out[region] = _perlin_noise_2d_region(
+            gradients, shape, res, region, interpolant, dtype)
+    return out
+
+
+def _perlin_gradients_2d(res, tileable, rng, dtype):
+    """Draw the gradients of a perlin noise, as generate_perlin_noise_2d does,
+    returned as separate x and y component arrays
+    """
+    if rng is None:
+        rng = np.random
+    angles = 2*np.pi*rng.random((res[0]+1, res[1]+1))
+    if tileable[0]:
+        angles[-1,:] = angles[0,:]
+    if tileable[1]:
+        angles[:,-1] = angles[:,0]
+    return np.cos(angles).astype(dtype), np.sin(angles).astype(dtype)
+
+
+def _perlin_noise_2d_region(gradients, shape, res, region, interpolant, dtype):
+    """Compute the part region (tuple of two slices) of the perlin noise of
+    shape shape with the given gradients
+    """
+    def axis_coordinates(axis):
+        # Cell index and position within the cell, computed exactly
+        index = np.arange(region[axis].start, region[axis].stop)
+        scaled = index * res[axis]
+        cell = scaled // shape[axis]
+        fraction = ((scaled - cell * shape[axis]) / shape[axis]).astype(dtype)
+        return cell, fraction
+
+    cell_r, fraction_r = axis_coordinates(0)
+    cell_c, fraction_c = axis_coordinates(1)
+    fraction_r = fraction_r[:, None]
+    fraction_c = fraction_c[None, :]
+    gradient_x, gradient_y = gradients
+
+    def ramp(row_offset, col_offset):
+        corner = np.ix_(cell_r + row_offset, cell_c + col_offset)
+        return ((fraction_r - row_offset) * gradient_x[corner]
+                + (fraction_c - col_offset) * gradient_y[corner])
+
+    t_r = interpolant(fraction_r)
+    t_c = interpolant(fraction_c)
+    n0 = ramp(0, 0)*(1-t_r) + t_r*ramp(1, 0)
+    n1 = ramp(0, 1)*(1-t_r) + t_r*ramp(1, 1)
+    return (np.sqrt(2)*((1-t_c)*n0 + t_c*n1)).astype(dtype, copy=False)
+
+
 def generate_fractal_noise_2d(
         shape, res, octaves=1, persistence=0.5,
         lacunarity=2, tileable=(False, False),
-        interpolant=interpolant
+        interpolant=interpolant, rng=None
 ):
     """Generate a 2D numpy array of fractal noise.
 
@@ -75,6 +163,8 @@ def generate_fractal_noise_2d(
             (tuple of two bools). Defaults to (False, False).
         interpolant: The, interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
 
     Returns:
         A numpy array of fractal noise and of shape shape generated by
@@ -89,8 +179,88 @@ def generate_fractal_noise_2d(
     amplitude = 1
     for _ in range(octaves):
         noise += amplitude * generate_perlin_noise_2d(
-            shape, (frequency*res[0], frequency*res[1]), tileable, interpolant
+            shape, (frequency*res[0], frequency*res[1]), tileable, interpolant,
+            rng
         )
         frequency *= lacunarity
         amplitude *= persistence
     return noise
+
+
+def generate_fractal_noise_2d_tiles(
+        shape, res, octaves=1, persistence=0.5,
+        lacunarity=2, tileable=(False, False),
+        interpolant=interpolant, rng=None, dtype=np.float64,
+        tile_shape=(1024, 1024)
+):
+    """Generate a 2D fractal noise one tile at a time.
+
+    The gradients of every octave are drawn up front (in the same order as
+    generate_fractal_noise_2d), and each tile is evaluated at its position in
+    the full array, so the tiles join seamlessly and the full array never has
+    to be held in memory.
+
+    Args:
+        shape: The shape of the full noise (tuple of two ints).
+        res: The number of periods of noise to generate along each
+            axis (tuple of two ints).
+        octaves: The number of octaves in the noise. Defaults to 1.
+        persistence: The scaling factor between two octaves.
+        lacunarity: The frequency factor between two octaves.
+        tileable: If the noise should be tileable along each axis
+            (tuple of two bools). Defaults to (False, False).
+        interpolant: The, interpolation function, defaults to
+            t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
+        dtype: The dtype the noise is computed in. Defaults to float64.
+        tile_shape: The shape of the tiles (tuple of two ints).
+
+    Yields:
+        (region, tile) tuples, where region is a tuple of two slices giving
+        the position of the tile in the full noise, in row-major order.
+    """
+    gradients = []
+    frequency = 1
+    for _ in range(octaves):
+        octave_res = (frequency*res[0], frequency*res[1])
+        gradients.append(
+            (octave_res, _perlin_gradients_2d(octave_res, tileable, rng, dtype)))
+        frequency *= lacunarity
+
+    for row in range(0, shape[0], tile_shape[0]):
+        for col in range(0, shape[1], tile_shape[1]):
+            region = (slice(row, min(row + tile_shape[0], shape[0])),
+                      slice(col, min(col + tile_shape[1], shape[1])))
+            tile = np.zeros((region[0].stop - row, region[1].stop - col),
+                            dtype=dtype)
+            amplitude = 1
+            for octave_res, octave_gradients in gradients:
+                tile += amplitude * _perlin_noise_2d_region(
+                    octave_gradients, shape, octave_res, region, interpolant,
+                    dtype)
+                amplitude *= persistence
+            yield region, tile
+
+
+def generate_fractal_noise_2d_memmap(
+        filename, shape, res, octaves=1, persistence=0.5,
+        lacunarity=2, tileable=(False, False),
+        interpolant=interpolant, rng=None, dtype=np.float64,
+        tile_shape=(1024, 1024)
+):
+    """Generate a 2D fractal noise into a .npy file, one tile at a time.
+
+    See generate_fractal_noise_2d_tiles for the arguments.
+
+    Returns:
+        A writeable np.memmap of the .npy file filename holding the noise.
+    """
+    out = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                    shape=tuple(shape))
+    for region, tile in generate_fractal_noise_2d_tiles(
+            shape, res, octaves, persistence, lacunarity, tileable,
+            interpolant, rng, dtype, tile_shape):
+        out[region] = tile
+    out.flush()
+    return out
@@ -5,7 +5,7 @@ from .perlin2d import interpolant
 
 def generate_perlin_noise_3d(
         shape, res, tileable=(False, False, False),
-        interpolant=interpolant
+        interpolant=interpolant, rng=None
 ):
     """Generate a 3D numpy array of perlin noise.
 
@@ -19,6 +19,8 @@ def generate_perlin_noise_3d(
             (tuple of three bools). Defaults to (False, False, False).
         interpolant: The interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
 
     Returns:
         A numpy array of shape shape with the generated noise.
@@ -32,8 +34,10 @@ def generate_perlin_noise_3d(
     grid = np.mgrid[0:res[0]:delta[0],0:res[1]:delta[1],0:res[2]:delta[2]]
     grid = grid.transpose(1, 2, 3, 0) % 1
     # Gradients
-    theta = 2*np.pi*np.random.rand(res[0] + 1, res[1] + 1, res[2] + 1)
-    phi = 2*np.pi*np.random.rand(res[0] + 1, res[1] + 1, res[2] + 1)
+    if rng is None:
+        rng = np.random
+    theta = 2*np.pi*rng.random((res[0] + 1, res[1] + 1, res[2] + 1))
+    phi = 2*np.pi*rng.random((res[0] + 1, res[1] + 1, res[2] + 1))
     gradients = np.stack(
         (np.sin(phi)*np.cos(theta), np.sin(phi)*np.sin(theta), np.cos(phi)),
         axis=3
@@ -75,7 +79,7 @@ def generate_perlin_noise_3d(
 
 def generate_fractal_noise_3d(
         shape, res, octaves=1, persistence=0.5, lacunarity=2,
-        tileable=(False, False, False), interpolant=interpolant
+        tileable=(False, False, False), interpolant=interpolant, rng=None
 ):
     """Generate a 3D numpy array of fractal noise.
 
@@ -92,6 +96,8 @@ def generate_fractal_noise_3d(
             (tuple of three bools). Defaults to (False, False, False).
         interpolant: The, interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy random Generator used for the gradients. Defaults
+            to the global numpy random state.
 
     Returns:
         A numpy array of fractal noise and of shape shape generated by
@@ -109,7 +115,8 @@ def generate_fractal_noise_3d(
             shape,
             (frequency*res[0], frequency*res[1], frequency*res[2]),
             tileable,
-            interpolant
+            interpolant,
+            rng
         )
         frequency *= lacunarity
         amplitude *= persistence
@@ -13,15 +13,22 @@ import os
 import shutil
 import argparse
 import importlib
+import json
 import signal
 import time
+import multiprocessing
+from multiprocessing import shared_memory
 
-from copy import copy, deepcopy
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from copy import copy
 from enum import Enum
+from functools import lru_cache
 
-from perlin_numpy import generate_perlin_noise_2d
+from perlin_numpy import generate_fractal_noise_2d_tiles
 
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 
 
 
@@ -31,31 +38,60 @@ class Store:
     
     Note that store_type should be a string that matches the stores defined
     in the game configuration.
+
+    store_id is None for stores created by players. Stores accepted by the
+    game are recorded as new Store objects with a store_id that is unique
+    within the game and never changes.
     """
-    def __init__(self, pos: Tuple[int, int], store_type: str):
+    def __init__(self, pos: Tuple[int, int], store_type: str,
+                 store_id: Optional[int] = None):
         self.pos = pos
         self.store_type = store_type
+        self.store_id = store_id
 
 def blend_rgba(datas):
     """ Return a numpy array that has blended RGBA data in the given list of 
     numpy arrays
+
+    The blend is computed in a single float32 pass over all the layers.
     """
-    blended = np.zeros(datas[0].shape).astype(float)
+    datas = np.stack(datas).astype(np.float32) / 255.0
+    alphas = datas[:,:,:,3]
+
+    # Total alpha of all layers, where a first layer with no alpha counts as 1
+    total_alpha = alphas.sum(axis=0) + (alphas[0] == 0)
 
-    total_alpha = np.zeros(datas[0].shape[:2])
-    np.where(total_alpha == 0, 1, total_alpha)
+    blended = np.empty(datas.shape[1:], dtype=np.float32)
+    blended[:,:,:3] = np.sqrt(
+        np.sum(np.square(datas[:,:,:,:3]) * (alphas / total_alpha)[:,:,:,None],
+               axis=0) / len(datas))
+    blended[:,:,3] = alphas.sum(axis=0) / len(datas)
+
+    return (blended * 255.0).astype(np.uint8)
 
-    for data in datas:
-        data = data.astype(float) / 255.0
-        total_alpha += data[:,:,3]
-        total_alpha = np.where(total_alpha == 0, 1, total_alpha)
 
-    for data in datas:
-        data = data.astype(float) / 255.0
-        blended[:,:,:3] += (np.square(data[:,:,:3]) * data[:,:,3][:,:,None] / total_alpha[:,:,None]) / len(datas)
-        blended[:,:,3] += data[:,:,3] / len(datas)
+def blend_allocations(colors: List[Tuple[int, int, int]],
+                      allocations: List[np.ndarray]) -> np.ndarray:
+    """ Return a numpy array with RGBA data blending one layer per player, of
+    the player's color with the player's allocation as alpha.
 
-    blended[:,:,:3] = np.sqrt(blended[:,:,:3])
+    Gives the same result as blend_rgba on those layers up to float32
+    rounding, without ever building the layers. The result is not
+    byte-identical: a channel can be one intensity level off, so a rendered
+    map image (see SiteLocationMap.render_image, which scales the alpha
+    again) can differ from the original rendering by up to two levels.
+    """
+    alphas = np.stack([(allocation * 255.0).astype(np.uint8)
+                       for allocation in allocations]).astype(np.float32) / 255.0
+    squared_colors = np.square(np.asarray(colors, dtype=np.float32) / 255.0)
+
+    total_alpha = alphas.sum(axis=0) + (alphas[0] == 0)
+
+    blended = np.empty(alphas.shape[1:] + (4,), dtype=np.float32)
+    blended[:,:,:3] = np.sqrt(
+        np.tensordot(alphas / total_alpha, squared_colors, axes=(0, 0))
+        / len(alphas))
+    blended[:,:,3] = alphas.sum(axis=0) / len(alphas)
 
     return (blended * 255.0).astype(np.uint8)
 
@@ -63,18 +99,268 @@ def blend_rgba(datas):
 class SiteLocationMap:
     """
     Represent the site location game map.
+
+    The population is generated from perlin noise, computed a few rows at a
+    time so any map size works. Given a seed, generation is deterministic, and
+    with a cache_dir the population is generated straight into a .npy file
+    there (keyed by size, res, seed and population) and memory mapped, read
+    only, so the map never has to fit in memory and is reused whenever the
+    same map is requested again.
+
+    The noise is always computed in float64, and the population is stored
+    with the given dtype (e.g. float32 to halve the memory of the map and of
+    everything computed from it).
     """
-    def __init__(self, size, seed=0, population=1000000):
+    def __init__(self, size, seed=None, population=1000000, res=(4, 4),
+                 cache_dir=None, dtype=np.float64):
+        dtype = np.dtype(dtype)
         self.size = size
         self.population = population
+        self.seed = seed
+        # Values derived from the population, shared with read only views
+        self._cache: Dict[str, object] = {}
+
+        cache_filename = None
+        if cache_dir is not None and seed is not None:
+            cache_filename = os.path.join(
+                cache_dir,
+                f"population-{size[0]}x{size[1]}-res{res[0]}x{res[1]}"
+                f"-seed{seed}-population{float(population)!r}"
+                f"{'' if dtype == np.float64 else '-' + dtype.name}.npy")
+            if os.path.exists(cache_filename):
+                self.population_distribution = np.load(cache_filename,
+                                                        mmap_mode="r")
+                return
+
+        rng = np.random.default_rng(seed) if seed is not None else None
+        if cache_filename is None:
+            self.population_distribution = self._generate_population(
+                np.empty(size, dtype), res, rng)
+            return
+
+        # Cached maps are generated straight into the file, so they never
+        # have to fit in memory
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_filename = f"{cache_filename}.{os.getpid()}.tmp"
+        noise = np.lib.format.open_memmap(temp_filename, mode="w+",
+                                          dtype=dtype, shape=tuple(size))
+        self._generate_population(noise, res, rng)
+        noise.flush()
+        del noise
+        os.replace(temp_filename, cache_filename)
+        self.population_distribution = np.load(cache_filename, mmap_mode="r")
+
+    def _generate_population(self, out, res, rng) -> np.ndarray:
+        """ Fill out with the population distribution, one tile of rows at a
+        time, and return it
+        """
+        tile_rows = max(1, 2**20 // max(self.size[1], 1))
+        tiles = generate_fractal_noise_2d_tiles(self.size, res, rng=rng,
+                                                tile_shape=(tile_rows,
+                                                            self.size[1]))
+        total = 0.0
+        for region, tile in tiles:
+            np.maximum(tile, 0, out=tile)
+            total += np.sum(tile)
+            out[region] = tile
+
+        scale = self.population / total
+        for row in range(0, self.size[0], tile_rows):
+            out[row:row+tile_rows] *= scale
+        return out
+
+    @property
+    def population_distribution(self) -> np.ndarray:
+        """ The population of every grid location
+        """
+        return self._population_distribution
+
+    @population_distribution.setter
+    def population_distribution(self, population_distribution: np.ndarray):
+        self._population_distribution = population_distribution
+        # Start a new cache rather than clearing the one shared with read
+        # only views of the previous population
+        self._cache = {}
+
+    def invalidate_cache(self):
+        """ Discard every value derived from the population (see _cache).
+        Must be called after modifying population_distribution in place.
+        """
+        self._cache.clear()
 
-        noise = generate_perlin_noise_2d(size, 
-                                         (4, 4), 
-                                         (False, False))
-        noise = np.where(noise < 0, 0, noise)
-        noise *= population / np.sum(noise)
+    @property
+    def dtype(self) -> np.dtype:
+        """ The dtype of the population, which allocations on this map use
+        """
+        return self.population_distribution.dtype
+
+    def population_pyramid(self, levels: int = 3) -> List[np.ndarray]:
+        """ Returns a list of levels+1 read only population arrays, where
+        level k sums the population of blocks of 2**k x 2**k grid locations
+        (level 0 is population_distribution itself). Maps whose size is not a
+        multiple of the block size are padded with empty locations, so every
+        level holds the same total population. Levels are computed once and
+        cached.
+        """
+        pyramid = self._cache.setdefault("population_pyramid",
+                                         [self.population_distribution])
+        while len(pyramid) <= levels:
+            previous = pyramid[-1]
+            level = np.zeros(((previous.shape[0] + 1) // 2,
+                              (previous.shape[1] + 1) // 2), previous.dtype)
+            for row in range(2):
+                for col in range(2):
+                    part = previous[row::2, col::2]
+                    level[:part.shape[0], :part.shape[1]] += part
+            level.flags.writeable = False
+            pyramid.append(level)
+        return pyramid[:levels+1]
+
+    def summed_area_table(self) -> np.ndarray:
+        """ Returns the summed-area table (integral image) of the population,
+        a read only float64 array of shape (rows+1, cols+1) where [i, j] is
+        the population of the locations [:i, :j]. Computed once and cached.
+        """
+        if "summed_area_table" not in self._cache:
+            table = np.zeros((self.size[0] + 1, self.size[1] + 1), np.float64)
+            np.cumsum(self.population_distribution, axis=0, dtype=np.float64,
+                      out=table[1:, 1:])
+            np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+            table.flags.writeable = False
+            self._cache["summed_area_table"] = table
+        return self._cache["summed_area_table"]
+
+    def population_in_box(self, row_start: int, col_start: int,
+                          row_stop: int, col_stop: int) -> float:
+        """ Returns the population of the locations [row_start:row_stop,
+        col_start:col_stop], in constant time (see summed_area_table). Bounds
+        outside the map are clipped to it.
+        """
+        return float(self.population_in_boxes(
+            [(row_start, col_start, row_stop, col_stop)])[0])
 
-        self.population_distribution = noise
+    def population_in_boxes(self, boxes) -> np.ndarray:
+        """ Returns the population of each of the boxes, an array-like of
+        (row_start, col_start, row_stop, col_stop) integer bounds, see
+        population_in_box
+        """
+        table = self.summed_area_table()
+        boxes = np.asarray(boxes, dtype=np.intp).reshape(-1, 4)
+        row_start, col_start, row_stop, col_stop = np.clip(
+            boxes, 0, [self.size[0], self.size[1]] * 2).T
+        row_stop = np.maximum(row_start, row_stop)
+        col_stop = np.maximum(col_start, col_stop)
+        return (table[row_stop, col_stop] - table[row_start, col_stop]
+                - table[row_stop, col_start] + table[row_start, col_start])
+
+    def population_within(self, points, radius: float,
+                          metric: str = "euclidian") -> np.ndarray:
+        """ Returns the population of the locations closer than radius to
+        each of the points, an array-like of (row, col) positions.
+
+        The disc ("euclidian") or diamond ("manhatten") around each point is
+        covered by one box per grid row, so a query takes O(radius) time.
+        Locations lying on the boundary itself may be counted or not,
+        depending on rounding.
+        """
+        if metric not in ("euclidian", "manhatten"):
+            raise ValueError(f"Unknown metric: {metric}")
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not np.isfinite(radius):
+            return np.full(len(points), self.summed_area_table()[-1, -1])
+        reach = int(np.ceil(max(radius, 0)))
+        rows = np.floor(points[:, :1]) + np.arange(-reach, reach + 2)
+        row_offsets = np.abs(rows - points[:, :1])
+        if metric == "euclidian":
+            half_widths = np.sqrt(np.maximum(radius**2 - row_offsets**2, 0))
+        else:
+            half_widths = np.maximum(radius - row_offsets, 0)
+        # Columns strictly within half_width of the point, none where the
+        # row is out of reach
+        col_start = np.floor(points[:, 1:] - half_widths) + 1
+        col_stop = np.where(half_widths > 0,
+                            np.ceil(points[:, 1:] + half_widths), col_start)
+        boxes = np.stack([rows, col_start, rows + 1, col_stop], axis=-1)
+        return self.population_in_boxes(boxes.reshape(-1, 4)).reshape(
+            len(points), -1).sum(axis=1)
+
+    def density_ranking(self) -> np.ndarray:
+        """ Returns the flat indices of every grid location, from the most to
+        the least populated, as a read only array. Computed once and cached.
+        """
+        if "density_ranking" not in self._cache:
+            ranking = np.argsort(self.population_distribution.ravel())[::-1]
+            ranking.flags.writeable = False
+            self._cache["density_ranking"] = ranking
+        return self._cache["density_ranking"]
+
+    def top_cells(self, k: int = 1, min_dist: float = 0,
+                  exclude_points=()) -> np.ndarray:
+        """ Returns an array of up to k (row, col) grid locations with the
+        highest population, among the locations at least min_dist (euclidian
+        distance) away from every one of exclude_points and from each other.
+
+        Locations are picked greedily in density_ranking order: the locations
+        closer than min_dist to the exclude points are blocked out of a mask
+        first, and every picked location blocks its own surroundings, so each
+        pick only looks at the mask for the next few ranked locations.
+
+        Arguments:
+        - k: maximum number of locations
+        - min_dist: minimum distance to the exclude points and between the
+          returned locations
+        - exclude_points: array-like of (row, col) positions, e.g. store
+          positions
+        """
+        ranking = self.density_ranking()
+        blocked = np.zeros(self.size, dtype=bool)
+        for point in np.asarray(exclude_points, dtype=float).reshape(-1, 2):
+            self._block_around(blocked, point, min_dist)
+
+        flat_blocked = blocked.reshape(-1)
+        cells = []
+        start = 0
+        batch = 4096
+        while len(cells) < k and start < len(ranking):
+            candidates = ranking[start:start+batch]
+            free = np.flatnonzero(~flat_blocked[candidates])
+            if len(free) == 0:
+                start += batch
+                continue
+            cell = np.unravel_index(candidates[free[0]], self.size)
+            cells.append(cell)
+            blocked[cell] = True
+            self._block_around(blocked, cell, min_dist)
+            # The picked location is blocked too, so scanning can carry on
+            # from it
+            start += free[0]
+        return np.array(cells, dtype=int).reshape(-1, 2)
+
+    def _block_around(self, blocked: np.ndarray, point, radius: float):
+        """ Set blocked (an array of size self.size) to True for every grid
+        location closer than radius to point
+        """
+        if radius <= 0:
+            return
+        rows = slice(max(int(np.floor(point[0] - radius)), 0),
+                     max(int(np.ceil(point[0] + radius)) + 1, 0))
+        cols = slice(max(int(np.floor(point[1] - radius)), 0),
+                     max(int(np.ceil(point[1] + radius)) + 1, 0))
+        row_offsets = np.arange(rows.start, min(rows.stop, self.size[0])) - point[0]
+        col_offsets = np.arange(cols.start, min(cols.stop, self.size[1])) - point[1]
+        distances = np.sqrt(np.square(row_offsets)[:, None]
+                            + np.square(col_offsets)[None, :])
+        blocked[rows, cols] |= distances < radius
+
+    def read_only_view(self) -> "SiteLocationMap":
+        """ Returns a copy of the map that shares its population_distribution
+        with this map, without copying it, as a write protected view
+        """
+        view = copy(self)
+        # Set directly, so the view keeps sharing the cache of this map
+        view._population_distribution = self.population_distribution.view()
+        view._population_distribution.flags.writeable = False
+        return view
 
     def save_image(self, filename, players={}, stores={}, allocations={}):
         """ Save an image of the map
@@ -85,49 +371,61 @@ class SiteLocationMap:
         - stores: stores for each player, by id
         - allocations: allocation percentages over the grid for each player, by id
         """
-        data = np.zeros((self.population_distribution.shape[0],
-                         self.population_distribution.shape[1],
-                         4), dtype=np.uint8)
-        
-        pop_norm = self.population_distribution
-        self.population_distribution *= 255.0 / pop_norm.max()
+        colors = {player_id: player.color for player_id, player in players.items()}
+        self.render_image(colors, stores, allocations).save(filename)
+
+    def render_image(self, colors, stores, allocations) -> Image.Image:
+        """ Returns a PIL image of the map, see save_image
 
-        data[:,:,0] += pop_norm.astype(np.uint8)
-        data[:,:,1] += pop_norm.astype(np.uint8)
-        data[:,:,2] += pop_norm.astype(np.uint8)
-        data[:,:,3] = 255
+        Images are rendered in float32 (see blend_allocations), so individual
+        pixels can be a level or two off the original float64 rendering, and
+        reports are not byte-identical across versions.
 
-        image = Image.fromarray(data, 'RGBA')
+        Arguments:
+        - colors: color of each player, by id
+        - stores: stores for each player, by id
+        - allocations: allocation percentages over the grid for each player, by id
+        """
+        pop_norm, data = self.base_layer()
+        image = Image.fromarray(data, 'RGBA').copy()
 
         draw = ImageDraw.Draw(image)
-        allocation_images = []
-        for player_id, player in players.items():
+        for player_id, color in colors.items():
             for store in stores[player_id]:
                 pointsize = 3
                 draw.ellipse((store.pos[1]-pointsize,
                               store.pos[0]-pointsize,
                               store.pos[1]+pointsize,
                               store.pos[0]+pointsize),
-                             player.color)
-
-            allocation = allocations[player_id]
-            al_data = np.zeros((self.population_distribution.shape[0],
-                                self.population_distribution.shape[1],
-                                4), dtype=np.uint8)
-
-            al_data[:,:,0] = player.color[0]
-            al_data[:,:,1] = player.color[1]
-            al_data[:,:,2] = player.color[2]
-            al_data[:,:,3] = 255
-            al_data[:,:,3] = (allocation[:,:] * al_data[:,:,3].astype(float)).astype(np.uint8)
-            allocation_images.append(al_data)
+                             color)
+        if not colors:
+            return image
 
-        blended = blend_rgba(allocation_images)
+        blended = blend_allocations(list(colors.values()),
+                                    [allocations[player_id] for player_id in colors])
         #blended[:,:,:3] = np.where(pop_norm[:,:,None] == 0, 0, blended[:,:,:3])
         blended[:,:,3] = pop_norm[:,:] * 2 / 255.0 * blended[:,:,3]
 
         image.paste(Image.fromarray(blended), (0, 0), Image.fromarray(blended))
-        image.save(filename)
+        return image
+
+    def base_layer(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns (pop_norm, data), the population scaled to 0-255 and the
+        greyscale RGBA image of it that every map image is drawn on. Computed
+        once and cached.
+        """
+        if "base_layer" not in self._cache:
+            pop_norm = self.population_distribution \
+                * (255.0 / self.population_distribution.max())
+
+            data = np.empty((pop_norm.shape[0], pop_norm.shape[1], 4),
+                            dtype=np.uint8)
+            data[:,:,:3] = pop_norm.astype(np.uint8)[:,:,None]
+            data[:,:,3] = 255
+            pop_norm.flags.writeable = False
+            data.flags.writeable = False
+            self._cache["base_layer"] = (pop_norm, data)
+        return self._cache["base_layer"]
 
 class SiteLocationPlayer:
     """
@@ -135,6 +433,14 @@ class SiteLocationPlayer:
 
     Hackathon participants should create their AI class by inheriting from
     this class and overriding the place_stores method
+
+    The same player object is used for the whole game, so players can keep
+    state between rounds. Players that keep derived state (indexes, fields)
+    can override observe_stores to update it with only the new stores.
+
+    Before observe_stores, the game sets self.store_index to a StoreIndex of
+    every store in store_locations, for nearest store and radius queries.
+    It is maintained by the game and must not be modified.
     """
 
     def __init__(self, player_id: int, config: Dict):
@@ -144,6 +450,7 @@ class SiteLocationPlayer:
         self.name = f"{self.__class__.__name__}-{self.player_id}"
         self.color = self._get_color()
         self.stores_to_place: List[Store] = []
+        self.store_index: Optional["StoreIndex"] = None
 
     def place_stores(self, slmap: SiteLocationMap, 
                      store_locations: Dict[int, List[Store]],
@@ -154,7 +461,9 @@ class SiteLocationPlayer:
         there are not enough funds to place all of them.
 
         Arguments:
-        - slmap: SiteLocationMap for the current round
+        - slmap: SiteLocationMap for the current round, its
+          population_distribution is a write protected view shared with the
+          game
         - store_locations: currently exisiting stores for all players, by id
           e.g. your current stores are: store_locations[self.player_id]
         - current_funds: amount of money available to spend on stores
@@ -164,6 +473,20 @@ class SiteLocationPlayer:
         See ./example_players.py for basic example implementations.
         """
         raise NotImplementedError()
+
+    def observe_stores(self, new_stores: Dict[int, List[Store]]):
+        """ Called every round just before place_stores with the stores added
+        by each player since the previous call (empty lists in the first
+        round). Every store in store_locations has been passed to
+        observe_stores exactly once, as the same Store object.
+
+        Does nothing by default.
+
+        Arguments:
+        - new_stores: stores placed in the previous round for all players,
+          by id
+        """
+        pass
     
     def _get_color(self) -> Tuple[int, int, int]:
         colors = [
@@ -180,12 +503,35 @@ class SiteLocationPlayer:
 DEFAULT_CONFIGURATION = {
     "map_size": (400, 400),
     "population": 1e6,
+    # Seed for the population map, None for a different map every game
+    "map_seed": None,
+    # Directory to cache seeded population maps in, None to disable
+    "map_cache_dir": None,
     "n_rounds": 10,
     "starting_cash": 70000,
     "profit_per_customer": 0.5,
     "max_stores_per_round": 2,
     "place_stores_time_s": 10,
     "ignore_player_exceptions": True,
+    # Run each player in its own worker process, with hard time limits (a
+    # player that times out places no stores that round)
+    "player_sandbox": False,
+    # Call place_stores for all players at the same time instead of in turn.
+    # Players outside the player_sandbox run on threads, so pure python
+    # players only overlap where they release the GIL (e.g. in numpy)
+    "concurrent_players": False,
+    # Number of most recent rounds of allocations kept in memory (None keeps
+    # every round), older rounds are recomputed when needed
+    "history_rounds": None,
+    # dtype allocations of earlier rounds are stored with, e.g. "float32"
+    "history_dtype": "float64",
+    # dtype of the population map and of the distance, attractiveness and
+    # allocation grids computed from it, "float32" halves their memory
+    # traffic (scores are still summed in float64)
+    "numeric_dtype": "float64",
+    # Only compute each round's scores, without keeping the allocations of
+    # every player (they are recomputed if needed, e.g. for the report)
+    "score_only": False,
     "store_config": {
         "small": {
             "capital_cost": 10000.0,
@@ -208,60 +554,323 @@ DEFAULT_CONFIGURATION = {
     }
 }
 
-def manhatten_distances(size, point):
+@lru_cache(maxsize=None)
+def grid_coordinates(size, dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns the (read only) coordinates of the grid rows and columns for a
+    map of size size, as used by all the distance functions
+    """
+    x = np.linspace(0, size[0], size[0], dtype=dtype)
+    y = np.linspace(0, size[1], size[1], dtype=dtype)
+    x.flags.writeable = False
+    y.flags.writeable = False
+    return x, y
+
+
+def grid_window(size, point, radius) -> Tuple[slice, slice]:
+    """ Returns the slices of the grid containing every location within radius
+    of point (plus a margin of one unit)
+    """
+    x, y = grid_coordinates(tuple(size))
+    if not np.isfinite(radius):
+        return slice(0, len(x)), slice(0, len(y))
+    return (slice(np.searchsorted(x, point[0] - radius - 1, "left"),
+                  np.searchsorted(x, point[0] + radius + 1, "right")),
+            slice(np.searchsorted(y, point[1] - radius - 1, "left"),
+                  np.searchsorted(y, point[1] + radius + 1, "right")))
+
+
+def manhatten_distances(size, point, window=None, dtype=np.float64):
     """ Returns a numpy array of size size, with manhatten distances from the
     given point for every location in the array 
+
+    If window is given (see grid_window), only that part of the array is
+    returned. Distances are computed in dtype.
     """
-    x = np.linspace(0, size[0], size[0])
-    y = np.linspace(0, size[1], size[1])
+    x, y = grid_coordinates(tuple(size), np.dtype(dtype))
+    if window is not None:
+        x, y = x[window[0]], y[window[1]]
+    point = np.asarray(point, dtype=dtype)
 
     distances = abs(x[:, None] - point[0]) + abs(y[None, :] - point[1])
     return distances
 
 
-def euclidian_distances(size, point):
+def euclidian_distances(size, point, window=None, dtype=np.float64):
     """ Returns a numpy array of size size, with euclidian distances from the
     given point for every location in the array 
+
+    If window is given (see grid_window), only that part of the array is
+    returned. Distances are computed in dtype.
     """
-    x = np.linspace(0, size[0], size[0])
-    y = np.linspace(0, size[1], size[1])
+    x, y = grid_coordinates(tuple(size), np.dtype(dtype))
+    if window is not None:
+        x, y = x[window[0]], y[window[1]]
+    point = np.asarray(point, dtype=dtype)
 
     distances = np.sqrt(np.square(x[:, None] - point[0]) + np.square(y[None, :] - point[1]))
     return distances
 
 
+def manhatten_distance_transform(size, points, max_dist=np.inf,
+                                 dtype=np.float64
+                                 ) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns (distances, labels), numpy arrays of size size with the
+    manhatten distance from every location to the closest of the given
+    points, and the index of that point in points. Locations with no point
+    within max_dist have distance inf and label -1.
+
+    The distance is separable, so it is computed in two passes: first the
+    distance along the rows from every grid row to the closest point of each
+    distinct point column, then, along the columns, the lower envelope of
+    those distances plus the distance to the column. This takes
+    O(map + rows * columns with points) whatever the number of points. The
+    distance to the labelled point is then computed exactly as
+    manhatten_distances would.
+
+    Arguments:
+    - size: size of the map
+    - points: array-like of (row, col) positions
+    - max_dist: distances beyond max_dist are not computed
+    - dtype: dtype of the distances
+    """
+    x, y = grid_coordinates(tuple(size), np.dtype(dtype))
+    points = np.asarray(points, dtype=dtype).reshape(-1, 2)
+    distances = np.full(size, np.inf, dtype)
+    labels = np.full(size, -1, dtype=np.intp)
+    if len(points) == 0:
+        return distances, labels
+
+    # First pass: for every row and point column, the closest point in that
+    # column along the row
+    columns, column_index = np.unique(points[:, 1], return_inverse=True)
+    order = np.lexsort((points[:, 0], column_index))
+    group_ends = np.cumsum(np.bincount(column_index, minlength=len(columns)))
+    row_labels = np.empty((len(x), len(columns)), dtype=np.intp)
+    group_start = 0
+    for column, group_end in enumerate(group_ends):
+        group = order[group_start:group_end]
+        group_start = group_end
+        rows = points[group, 0]
+        upper = np.minimum(np.searchsorted(rows, x), len(rows) - 1)
+        lower = np.maximum(upper - 1, 0)
+        closer_lower = np.abs(x - rows[lower]) < np.abs(x - rows[upper])
+        row_labels[:, column] = group[np.where(closer_lower, lower, upper)]
+    row_distances = np.abs(x[:, None] - points[row_labels, 0])
+    reachable_row_distances = np.where(row_distances > max_dist, np.inf,
+                                       row_distances)
+
+    # Second pass: the closest point column at or before, and at or after,
+    # every grid column, from running minimums over the point columns
+    def running_argmin(values):
+        minimum = np.minimum.accumulate(values, axis=1)
+        index = np.where(values == minimum, np.arange(values.shape[1]), 0)
+        return np.maximum.accumulate(index, axis=1)
+
+    n_columns = len(columns)
+    before = running_argmin(reachable_row_distances - columns)
+    after = n_columns - 1 - running_argmin(
+        (reachable_row_distances + columns)[:, ::-1])[:, ::-1]
+    before = before[:, np.maximum(np.searchsorted(columns, y, "right") - 1, 0)]
+    after = after[:, np.minimum(np.searchsorted(columns, y, "left"),
+                                n_columns - 1)]
+
+    # The closest point is one of the two, measure both exactly the same way
+    # as manhatten_distances does, so the result doesn't depend on the order
+    # of the sums above. (Where there is no column on one side, the other
+    # side's candidate is used twice.)
+    rows = np.arange(len(x))[:, None]
+    before_distances = row_distances[rows, before] + np.abs(y - columns[before])
+    after_distances = row_distances[rows, after] + np.abs(y - columns[after])
+    use_before = before_distances <= after_distances
+    distances = np.where(use_before, before_distances, after_distances)
+    labels = row_labels[rows, np.where(use_before, before, after)]
+    unreachable = distances > max_dist
+    distances[unreachable] = np.inf
+    labels[unreachable] = -1
+    return distances, labels
+
+
+def _closest_store_distances(slmap: SiteLocationMap, positions, max_dist
+                             ) -> np.ndarray:
+    """ Returns the manhatten distance from every location to the closest of
+    the given positions, inf where it is further than max_dist
+    """
+    windows = [grid_window(slmap.size, pos, max_dist) for pos in positions]
+    window_cells = sum((window[0].stop - window[0].start)
+                       * (window[1].stop - window[1].start)
+                       for window in windows)
+    # The transform makes a few dozen passes over the map, so it only pays
+    # off once the windows cover the map many times over
+    if window_cells > 32 * slmap.size[0] * slmap.size[1]:
+        return manhatten_distance_transform(slmap.size, positions, max_dist,
+                                            slmap.dtype)[0]
+
+    least_distance = np.full(slmap.size, np.inf, dtype=slmap.dtype)
+    for pos, window in zip(positions, windows):
+        distances = manhatten_distances(slmap.size, pos, window, slmap.dtype)
+        np.minimum(least_distance[window], distances,
+                   out=least_distance[window])
+    least_distance[least_distance > max_dist] = np.inf
+    return least_distance
+
+
 def closest_store_allocation(slmap: SiteLocationMap,
                              players: Dict[int, SiteLocationPlayer],
                              stores: Dict[int, List[Store]],
                              store_config=None,
-                             max_dist=50
+                             max_dist=50,
+                             ties="share"
                              ):
-    # TODO handle case when no stores created
-    distances_by_player = {}
-    global_min = None
-    for player_id, player in players.items():
-        least_distance = None
-        for store in stores[player_id]:
-            distances = manhatten_distances(slmap.size, store.pos)
-            if least_distance is None:
-                least_distance = distances
-            else:
-                least_distance = np.minimum(least_distance, distances)
-        distances_by_player[player_id] = least_distance
-        if global_min is None:
-            global_min = least_distance
-        else:
-            global_min = np.minimum(least_distance, global_min)
+    """ Returns population allocation for the given map, players and stores,
+    where every grid location within max_dist (manhatten distance) of a store
+    is allocated to the player with the closest store.
 
-    player_allocations = {}
-    for player_id in players:
-        player_least_distances = distances_by_player[player_id]
-        player_allocations[player_id] = (
-            (player_least_distances <= global_min)
-            & (player_least_distances <= max_dist)
-        ).astype(float)
+    ties decides locations where several players' closest stores are equally
+    close: "share" allocates the whole location to each of them, "split"
+    allocates an equal fraction to each, and "first" allocates it to the
+    first of them (in the order of players).
 
-    return player_allocations
+    The distances of each player are computed with
+    manhatten_distance_transform when the player has enough stores (or
+    max_dist is large enough) for it to be cheaper than updating the window
+    around every store.
+
+    Arguments:
+    - slmap: SiteLocationMap object
+    - players: players by id
+    - stores: all stores for each player by id
+    - store_config: unused
+    - max_dist: locations further than max_dist from every store are not
+      allocated
+    - ties: "share", "split" or "first"
+    """
+    if ties not in ("share", "split", "first"):
+        raise ValueError(f"Unknown ties mode: {ties}")
+
+    distances_by_player = {}
+    global_min = np.full(slmap.size, np.inf, slmap.dtype)
+    for player_id in players:
+        distances = _closest_store_distances(
+            slmap, [store.pos for store in stores[player_id]], max_dist)
+        distances_by_player[player_id] = distances
+        np.minimum(global_min, distances, out=global_min)
+
+    closest_by_player = {
+        player_id: (distances <= global_min) & np.isfinite(distances)
+        for player_id, distances in distances_by_player.items()}
+
+    if ties == "split":
+        n_closest = np.zeros(slmap.size, slmap.dtype)
+        for closest in closest_by_player.values():
+            n_closest += closest
+        n_closest[n_closest == 0] = 1
+        return {player_id: closest / n_closest
+                for player_id, closest in closest_by_player.items()}
+
+    if ties == "first":
+        claimed = np.zeros(slmap.size, dtype=bool)
+        for closest in closest_by_player.values():
+            closest &= ~claimed
+            claimed |= closest
+
+    return {player_id: closest.astype(slmap.dtype)
+            for player_id, closest in closest_by_player.items()}
+
+
+def store_radius(store_type_config: Dict[str, float]) -> float:
+    """ Returns the distance beyond which a store with the given store type
+    configuration has no attractiveness
+    """
+    if store_type_config["attractiveness_constant"] <= 0:
+        return np.inf
+    return (store_type_config["attractiveness"]
+            / store_type_config["attractiveness_constant"])
+
+
+def store_attractiveness(size, store: Store,
+                         store_config: Dict[str, Dict[str, float]],
+                         dtype=np.float64
+                         ) -> Tuple[Tuple[slice, slice], np.ndarray]:
+    """ Returns (window, attractiveness) for the given store, where window is
+    the part of a map of size size within the store's radius (see grid_window)
+    and attractiveness is a numpy array of dtype with the attractiveness of
+    the store (clipped at zero) for every location in the window.
+
+    The store has no attractiveness anywhere outside the window.
+    """
+    store_type_config = store_config[store.store_type]
+    window = grid_window(size, store.pos, store_radius(store_type_config))
+    distances = euclidian_distances(size, store.pos, window, dtype)
+    attractiveness = \
+        store_type_config["attractiveness"] \
+        / np.maximum(distances, 1.0) \
+        - store_type_config["attractiveness_constant"] 
+    return window, np.where(attractiveness < 0, 0, attractiveness)
+
+
+@lru_cache(maxsize=16)
+def attractiveness_levels(size, attractiveness: float, constant: float,
+                          n_levels: int
+                          ) -> Tuple[Tuple[int, int], List[float], List[np.ndarray]]:
+    """ Returns (half_widths, values, kernels) describing the attractiveness of
+    a store, relative to its own location, as a stack of n_levels rings.
+
+    kernels are boolean arrays of shape (2*half_widths[0]+1,
+    2*half_widths[1]+1), centered on the store, marking the locations where
+    the store's attractiveness falls into each level, and values holds the
+    mean attractiveness of each level. Levels are spaced geometrically so the
+    relative error of the rings is the same near and far from the store.
+    """
+    x, y = grid_coordinates(size)
+    spacing = (x[1] - x[0] if len(x) > 1 else 1.0,
+               y[1] - y[0] if len(y) > 1 else 1.0)
+    radius = store_radius({"attractiveness": attractiveness,
+                           "attractiveness_constant": constant})
+    half_widths = tuple(int(min(np.ceil(radius / spacing[i]) + 1, size[i]))
+                        for i in range(2))
+
+    distances = np.sqrt(
+        np.square(np.arange(-half_widths[0], half_widths[0]+1) * spacing[0])[:, None]
+        + np.square(np.arange(-half_widths[1], half_widths[1]+1) * spacing[1])[None, :])
+    store_attractiveness = attractiveness / np.maximum(distances, 1.0) - constant
+    positive = store_attractiveness > 0
+    if not np.any(positive):
+        return half_widths, [], []
+
+    edges = np.geomspace(store_attractiveness[positive].min(),
+                         store_attractiveness.max(), n_levels + 1)
+    level = np.clip(np.searchsorted(edges, store_attractiveness, "right") - 1,
+                    0, n_levels - 1)
+    values = []
+    kernels = []
+    for i in range(n_levels):
+        kernel = positive & (level == i)
+        if np.any(kernel):
+            values.append(float(store_attractiveness[kernel].mean()))
+            kernels.append(kernel)
+    return half_widths, values, kernels
+
+
+def attractiveness_fields(slmap: SiteLocationMap,
+                          stores: Dict[int, List[Store]],
+                          store_config: Dict[str, Dict[str, float]]
+                          ) -> Tuple[Dict[int, np.ndarray], np.ndarray]:
+    """ Returns (attractiveness_by_player, total_attractiveness): the max
+    attractiveness of each player's stores at every grid location, by player
+    id, and the sum of those over all players, in the dtype of the map
+    """
+    attractiveness_by_player = {}
+    total_attractiveness = np.zeros(slmap.size, slmap.dtype)
+    for player_id in stores:
+        best_attractiveness = np.zeros(slmap.size, slmap.dtype)
+        for store in stores[player_id]:
+            window, attractiveness = store_attractiveness(
+                slmap.size, store, store_config, slmap.dtype)
+            np.maximum(best_attractiveness[window], attractiveness,
+                       out=best_attractiveness[window])
+        attractiveness_by_player[player_id] = best_attractiveness
+        total_attractiveness += best_attractiveness
+    return attractiveness_by_player, total_attractiveness
 
 
 def attractiveness_allocation(slmap: SiteLocationMap,
@@ -287,22 +896,11 @@ def attractiveness_allocation(slmap: SiteLocationMap,
     - slmap: SiteLocationMap object
     - stores: all stores for each player by id
     - store_config: configuration from the game config
-    """
 
-    attractiveness_by_player = {}
-    total_attractiveness = np.zeros(slmap.size)
-    for player_id in stores:
-        best_attractiveness = np.zeros(slmap.size)
-        for store in stores[player_id]:
-            distances = euclidian_distances(slmap.size, store.pos)
-            attractiveness = \
-                store_config[store.store_type]["attractiveness"] \
-                / np.maximum(distances, np.ones(distances.shape)) \
-                - store_config[store.store_type]["attractiveness_constant"] 
-            attractiveness = np.where(attractiveness < 0, 0, attractiveness)
-            best_attractiveness = np.maximum(best_attractiveness, attractiveness)
-        attractiveness_by_player[player_id] = best_attractiveness
-        total_attractiveness += best_attractiveness
+    The fields are computed in the dtype of the map.
+    """
+    attractiveness_by_player, total_attractiveness = attractiveness_fields(
+        slmap, stores, store_config)
     total_attractiveness = np.where(total_attractiveness == 0, 
                                     1, total_attractiveness)
 
@@ -314,6 +912,878 @@ def attractiveness_allocation(slmap: SiteLocationMap,
     return player_allocations
 
 
+def attractiveness_revenue(slmap: SiteLocationMap,
+                           stores: Dict[int, List[Store]],
+                           store_config: Dict[str, Dict[str, float]],
+                           profit_per_customer: float = 1.0
+                           ) -> Dict[int, float]:
+    """ Returns the revenue of each player by id, i.e. the population
+    allocated by attractiveness_allocation times profit_per_customer, without
+    returning the allocation of every player.
+
+    Only the attractiveness fields are kept, and each player's share is
+    summed into a single reused buffer, so the revenues are identical to
+    summing population_distribution * allocation (in float64) for the
+    allocations of attractiveness_allocation.
+
+    Arguments:
+    - slmap: SiteLocationMap object
+    - stores: all stores for each player by id
+    - store_config: configuration from the game config
+    - profit_per_customer: revenue per allocated person
+    """
+    attractiveness_by_player, total_attractiveness = attractiveness_fields(
+        slmap, stores, store_config)
+    return _revenues(slmap, attractiveness_by_player, total_attractiveness,
+                     profit_per_customer)
+
+
+def _revenues(slmap: SiteLocationMap,
+              attractiveness_by_player: Dict[int, np.ndarray],
+              total_attractiveness: np.ndarray,
+              profit_per_customer: float) -> Dict[int, float]:
+    """ Returns the revenue of each player from the players' best
+    attractiveness fields and their total, see attractiveness_revenue
+    """
+    total_attractiveness = np.where(total_attractiveness == 0,
+                                    1, total_attractiveness)
+    population = slmap.population_distribution
+    share = np.empty(slmap.size, slmap.dtype)
+    revenues = {}
+    for player_id, best_attractiveness in attractiveness_by_player.items():
+        np.divide(best_attractiveness, total_attractiveness, out=share)
+        np.multiply(population, share, out=share)
+        revenues[player_id] = np.sum(share, dtype=np.float64) \
+            * profit_per_customer
+    return revenues
+
+
+def approximate_attractiveness_allocation(slmap: SiteLocationMap,
+                                          stores: Dict[int, List[Store]],
+                                          store_config: Dict[str, Dict[str, float]],
+                                          level: int = 2
+                                          ) -> Tuple[Dict[int, np.ndarray], Dict[int, float]]:
+    """ Returns (allocations, error_bounds), an approximation of
+    attractiveness_allocation computed on level of the population pyramid
+    (see SiteLocationMap.population_pyramid), i.e. on blocks of
+    2**level x 2**level grid locations.
+
+    allocations holds the fraction of each block's population allocated to
+    each player, by id, with the attractiveness evaluated at the block
+    centers. error_bounds holds, for each player by id, a bound on the
+    difference between the population allocated to the player by the
+    approximation (the sum of allocation * block population) and by
+    attractiveness_allocation at full resolution. It comes from the smallest
+    and largest distance of every store to every block, so it is guaranteed.
+
+    Each level has 4 times fewer locations to evaluate than the one below,
+    so candidate positions can be screened on a coarse level and only the
+    best ones evaluated at full resolution. The bound is conservative, the
+    actual error is usually much smaller.
+
+    Arguments:
+    - slmap: SiteLocationMap object
+    - stores: all stores for each player by id
+    - store_config: configuration from the game config
+    - level: pyramid level to use, 0 is full resolution
+    """
+    population = slmap.population_pyramid(level)[level]
+    block = 2**level
+    dtype = slmap.dtype
+
+    # Coordinates of the first, last and center location of each block
+    bounds = []
+    for axis, coordinates in enumerate(grid_coordinates(tuple(slmap.size),
+                                                        dtype)):
+        n = len(coordinates)
+        starts = coordinates[0::block]
+        ends = coordinates[np.minimum(np.arange(len(starts)) * block
+                                      + block - 1, n - 1)]
+        bounds.append((starts, ends, (starts + ends) / 2))
+
+    center_by_player = {}
+    lower_by_player = {}
+    upper_by_player = {}
+    for player_id in stores:
+        center = np.zeros(population.shape, dtype)
+        lower = np.zeros(population.shape, dtype)
+        upper = np.zeros(population.shape, dtype)
+        for store in stores[player_id]:
+            store_type_config = store_config[store.store_type]
+            radius = store_radius(store_type_config)
+            window = []
+            offsets = []
+            for (starts, ends, centers), position in zip(bounds, store.pos):
+                if np.isfinite(radius):
+                    axis_window = slice(
+                        np.searchsorted(ends, position - radius - 1, "left"),
+                        np.searchsorted(starts, position + radius + 1, "right"))
+                else:
+                    axis_window = slice(0, len(starts))
+                window.append(axis_window)
+                starts = starts[axis_window]
+                ends = ends[axis_window]
+                centers = centers[axis_window]
+                offsets.append((
+                    np.abs(centers - position),
+                    np.maximum(np.maximum(starts - position,
+                                          position - ends), 0),
+                    np.maximum(np.abs(starts - position),
+                               np.abs(ends - position))))
+            window = tuple(window)
+
+            # Attractiveness falls with distance, so the nearest location of a
+            # block bounds it from above and the furthest from below
+            for field, index in ((center, 0), (upper, 1), (lower, 2)):
+                distances = np.sqrt(np.square(offsets[0][index])[:, None]
+                                    + np.square(offsets[1][index])[None, :])
+                attractiveness = \
+                    store_type_config["attractiveness"] \
+                    / np.maximum(distances, 1.0) \
+                    - store_type_config["attractiveness_constant"]
+                np.maximum(field[window], attractiveness, out=field[window])
+        center_by_player[player_id] = center
+        lower_by_player[player_id] = lower
+        upper_by_player[player_id] = upper
+
+    total = sum(center_by_player.values(), np.zeros(population.shape, dtype))
+    total_lower = sum(lower_by_player.values(), np.zeros(population.shape, dtype))
+    total_upper = sum(upper_by_player.values(), np.zeros(population.shape, dtype))
+    total = np.where(total == 0, 1, total)
+
+    allocations = {}
+    error_bounds = {}
+    for player_id in stores:
+        allocation = center_by_player[player_id] / total
+        allocations[player_id] = allocation
+
+        # Smallest and largest possible share of every location in a block:
+        # own attractiveness at its lowest against the others at their
+        # highest, and the other way around
+        lower = lower_by_player[player_id]
+        upper = upper_by_player[player_id]
+        others_upper = np.maximum(total_upper - upper, 0)
+        others_lower = np.maximum(total_lower - lower, 0)
+        lowest = np.divide(lower, lower + others_upper,
+                           out=np.zeros_like(lower),
+                           where=(lower + others_upper) > 0)
+        highest = np.divide(upper, upper + others_lower,
+                            out=np.zeros_like(upper),
+                            where=(upper + others_lower) > 0)
+
+        approximate = np.sum(population * allocation, dtype=np.float64)
+        error_bounds[player_id] = float(max(
+            approximate - np.sum(population * lowest, dtype=np.float64),
+            np.sum(population * highest, dtype=np.float64) - approximate,
+            0.0))
+    return allocations, error_bounds
+
+
+def marginal_gain_map(slmap: SiteLocationMap,
+                      stores: Dict[int, List[Store]],
+                      store_config: Dict[str, Dict[str, float]],
+                      player_id: int,
+                      store_type: str,
+                      n_levels: int = 32,
+                      profit_per_customer: float = 1.0) -> np.ndarray:
+    """ Returns a numpy array of the same size as the map, with the revenue
+    that player_id would gain (on top of their current allocation from
+    attractiveness_allocation) by placing a store of store_type at each grid
+    location, i.e. the gained population times profit_per_customer (the
+    population itself with the default of 1).
+
+    The whole map is computed with FFT convolutions of the store's
+    attractiveness rings (see attractiveness_levels) rather than one
+    allocation per location, so the result is approximate everywhere: the
+    rings quantize the attractiveness, and the result is resampled to the
+    n/(n-1) spacing of the grid coordinates. Even on an empty 400x400 map,
+    gains for small stores are typically about 1% off, and more near other
+    stores and the edges of the map. More n_levels only reduces the ring
+    quantization. Use it to shortlist locations, and
+    evaluate_store_candidates to score them exactly.
+
+    Arguments:
+    - slmap: SiteLocationMap object
+    - stores: all stores for each player by id
+    - store_config: configuration from the game config
+    - player_id: id of the player placing the store
+    - store_type: type of the store to place
+    - n_levels: number of attractiveness rings to use
+    - profit_per_customer: revenue per allocated person
+    """
+    engine = AttractivenessAllocationEngine(slmap, store_config)
+    engine.update(stores)
+    return engine.marginal_gain_map(player_id, store_type, n_levels,
+                                    profit_per_customer)
+
+
+def evaluate_store_candidates(slmap: SiteLocationMap,
+                              stores: Dict[int, List[Store]],
+                              store_config: Dict[str, Dict[str, float]],
+                              player_id: int,
+                              store_type: str,
+                              candidates,
+                              profit_per_customer: float = 1.0) -> np.ndarray:
+    """ Returns a numpy array with the revenue player_id would earn under
+    attractiveness_allocation if they added a store of store_type at each of
+    the K candidate positions, i.e. the allocated population times
+    profit_per_customer (the population itself with the default of 1).
+
+    All candidates are scored in one vectorized pass against the existing
+    attractiveness fields, which is much faster than calling
+    attractiveness_allocation once per candidate.
+
+    Arguments:
+    - slmap: SiteLocationMap object
+    - stores: all stores for each player by id
+    - store_config: configuration from the game config
+    - player_id: id of the player placing the store
+    - store_type: type of the store to place
+    - candidates: array-like of K (row, col) grid positions
+    - profit_per_customer: revenue per allocated person
+    """
+    engine = AttractivenessAllocationEngine(slmap, store_config)
+    engine.update(stores)
+    return engine.evaluate_candidates(player_id, store_type, candidates,
+                                      profit_per_customer)
+
+
+class AttractivenessAllocationEngine:
+    """
+    Stateful version of attractiveness_allocation.
+
+    Keeps each player's running max-attractiveness field and the total
+    attractiveness field between calls, so that only stores placed since the
+    last update have to be folded in. Store lists are expected to only grow
+    (as they do in SiteLocationGame); if a player's list does not extend the
+    stores already seen, the engine rebuilds its fields from scratch.
+
+    The allocations returned are identical to attractiveness_allocation for
+    the same stores.
+
+    fork() returns a copy that shares the fields with this engine until
+    either of them changes a field, so forking costs O(stores).
+    """
+    def __init__(self, slmap: SiteLocationMap,
+                 store_config: Dict[str, Dict[str, float]]):
+        self.slmap = slmap
+        self.store_config = store_config
+        self.best_attractiveness: Dict[int, np.ndarray] = {}
+        self.total_attractiveness = np.zeros(slmap.size, slmap.dtype)
+        self._stores: Dict[int, List[Store]] = {}
+        # Fields that are not shared with a fork, and can be changed in place
+        self._owned: Set[int] = set()
+        self._owns_total = True
+
+    def reset(self):
+        """ Forget all stores that have been folded into the fields
+        """
+        self.best_attractiveness = {}
+        self.total_attractiveness = np.zeros(self.slmap.size, self.slmap.dtype)
+        self._stores = {}
+        self._owned = set()
+        self._owns_total = True
+
+    def fork(self) -> "AttractivenessAllocationEngine":
+        """ Returns a copy of the engine. The fields are shared, copy on
+        write, so only the store lists are copied.
+        """
+        engine = copy(self)
+        engine.best_attractiveness = dict(self.best_attractiveness)
+        engine._stores = {player_id: list(player_stores)
+                          for player_id, player_stores in self._stores.items()}
+        for shared in (self, engine):
+            shared._owned = set()
+            shared._owns_total = False
+        return engine
+
+    def add_stores(self, player_id: int, new_stores: List[Store]):
+        """ Fold new_stores into the attractiveness field of player_id
+        """
+        if player_id not in self.best_attractiveness:
+            self.best_attractiveness[player_id] = np.zeros(self.slmap.size,
+                                                           self.slmap.dtype)
+            self._owned.add(player_id)
+            self._stores[player_id] = []
+        if not new_stores:
+            return
+
+        if player_id not in self._owned:
+            self.best_attractiveness[player_id] = \
+                self.best_attractiveness[player_id].copy()
+            self._owned.add(player_id)
+        best_attractiveness = self.best_attractiveness[player_id]
+        for store in new_stores:
+            window, attractiveness = store_attractiveness(
+                self.slmap.size, store, self.store_config, self.slmap.dtype)
+            np.maximum(best_attractiveness[window], attractiveness,
+                       out=best_attractiveness[window])
+            self._update_total(window)
+        self._stores[player_id].extend(new_stores)
+
+    def update(self, stores: Dict[int, List[Store]]):
+        """ Bring the fields up to date with stores, the complete list of
+        stores for each player by id
+        """
+        if not self._extends_known_stores(stores):
+            log.debug("Store lists changed, rebuilding attractiveness fields")
+            self.reset()
+
+        for player_id, player_stores in stores.items():
+            n_known = len(self._stores.get(player_id, []))
+            self.add_stores(player_id, player_stores[n_known:])
+
+    def allocations(self) -> Dict[int, np.ndarray]:
+        """ Returns population allocation for each player by id, see
+        attractiveness_allocation
+        """
+        total_attractiveness = np.where(self.total_attractiveness == 0,
+                                        1, self.total_attractiveness)
+        return {player_id: best_attractiveness / total_attractiveness
+                for player_id, best_attractiveness
+                in self.best_attractiveness.items()}
+
+    def revenues(self, profit_per_customer: float = 1.0) -> Dict[int, float]:
+        """ Returns the revenue of each player by id, without computing the
+        allocations, see attractiveness_revenue
+        """
+        return _revenues(self.slmap, self.best_attractiveness,
+                         self.total_attractiveness, profit_per_customer)
+
+    def evaluate_candidates(self, player_id: int, store_type: str,
+                            candidates, profit_per_customer: float = 1.0
+                            ) -> np.ndarray:
+        """ Returns a numpy array with the revenue player_id would earn if
+        they placed a store of store_type at each of the candidate positions
+        (in addition to the stores already in the engine), i.e. the allocated
+        population times profit_per_customer. With the default
+        profit_per_customer of 1 this is the allocated population.
+
+        Arguments:
+        - player_id: id of the player placing the store
+        - store_type: type of the store to place
+        - candidates: array-like of K (row, col) grid positions
+        - profit_per_customer: revenue per allocated person
+        """
+        candidates = np.asarray(candidates).reshape(-1, 2)
+        size = self.slmap.size
+        if (not np.issubdtype(candidates.dtype, np.integer)
+                or np.any(candidates < 0)
+                or np.any(candidates >= np.array(size))):
+            raise ValueError("Candidate positions must be grid locations on the map")
+        if player_id not in self.best_attractiveness:
+            self.add_stores(player_id, [])
+
+        store_type_config = self.store_config[store_type]
+        radius = store_radius(store_type_config)
+        # Half width of the window, in grid cells, that contains the radius
+        # of a store at any grid location (grid spacing is >= 1)
+        half = int(min(np.ceil(radius), max(size))) + 2
+        width = 2 * half + 1
+
+        dtype = self.slmap.dtype
+        own = self.best_attractiveness[player_id]
+        competitors = np.zeros(size, dtype)
+        for other_id, best_attractiveness in self.best_attractiveness.items():
+            if other_id != player_id:
+                competitors += best_attractiveness
+        total = np.where(self.total_attractiveness == 0,
+                         1, self.total_attractiveness)
+        population = self.slmap.population_distribution
+        current = np.sum(population * own / total, dtype=np.float64)
+
+        # Pad everything by the window half width, outside the map there is no
+        # population so those cells never contribute
+        pad = ((half, half), (half, half))
+        own = np.pad(own, pad)
+        competitors = np.pad(competitors, pad)
+        total = np.pad(total, pad, constant_values=1)
+        population = np.pad(population, pad)
+        x, y = grid_coordinates(tuple(size), dtype)
+        x = np.pad(x, half, mode="reflect", reflect_type="odd")
+        y = np.pad(y, half, mode="reflect", reflect_type="odd")
+
+        offsets = np.arange(width)
+        results = np.empty(len(candidates))
+        chunk = max(1, 2**20 // (width * width))
+        for start in range(0, len(candidates), chunk):
+            points = candidates[start:start+chunk]
+            rows = points[:, 0, None] + offsets[None, :]
+            cols = points[:, 1, None] + offsets[None, :]
+            index = (rows[:, :, None], cols[:, None, :])
+
+            positions = points.astype(dtype)
+            distances = np.sqrt(
+                np.square(x[rows] - positions[:, 0, None])[:, :, None]
+                + np.square(y[cols] - positions[:, 1, None])[:, None, :])
+            attractiveness = \
+                store_type_config["attractiveness"] \
+                / np.maximum(distances, 1.0) \
+                - store_type_config["attractiveness_constant"]
+            attractiveness = np.where(attractiveness < 0, 0, attractiveness)
+
+            own_window = own[index]
+            new_own = np.maximum(own_window, attractiveness)
+            new_total = new_own + competitors[index]
+            new_total = np.where(new_total == 0, 1, new_total)
+            gain = population[index] * (new_own / new_total
+                                        - own_window / total[index])
+            results[start:start+chunk] = current + gain.sum(axis=(1, 2),
+                                                            dtype=np.float64)
+        return results * profit_per_customer
+
+    def marginal_gain_map(self, player_id: int, store_type: str,
+                          n_levels: int = 32,
+                          profit_per_customer: float = 1.0) -> np.ndarray:
+        """ Returns a numpy array of the same size as the map with the
+        revenue player_id would gain by placing a store of store_type at each
+        grid location, see marginal_gain_map
+        """
+        if player_id not in self.best_attractiveness:
+            self.add_stores(player_id, [])
+
+        size = tuple(self.slmap.size)
+        store_type_config = self.store_config[store_type]
+        half_widths, values, kernels = attractiveness_levels(
+            size,
+            store_type_config["attractiveness"],
+            store_type_config["attractiveness_constant"],
+            n_levels)
+
+        own = self.best_attractiveness[player_id]
+        competitors = self.total_attractiveness - own
+        total = np.where(self.total_attractiveness == 0,
+                         1, self.total_attractiveness)
+        population = self.slmap.population_distribution
+        current = own / total
+
+        # The gain at q is sum_x gain_level(x) * kernel_level(x - q) over all
+        # levels, i.e. a correlation with a symmetric kernel, computed as a
+        # linear convolution padded so nothing wraps around
+        fft_shape = (size[0] + 2*half_widths[0], size[1] + 2*half_widths[1])
+        spectrum = np.zeros((fft_shape[0], fft_shape[1]//2 + 1), dtype=complex)
+        for value, kernel in zip(values, kernels):
+            new_own = np.maximum(own, value)
+            new_total = new_own + competitors
+            new_total = np.where(new_total == 0, 1, new_total)
+            level_gain = population * (new_own / new_total - current)
+            spectrum += (np.fft.rfft2(level_gain, fft_shape)
+                         * np.fft.rfft2(kernel, fft_shape))
+
+        gain = np.fft.irfft2(spectrum, fft_shape)
+        gain = gain[half_widths[0]:half_widths[0]+size[0],
+                    half_widths[1]:half_widths[1]+size[1]]
+
+        # Store positions are compared against grid coordinates with a
+        # spacing of n/(n-1), so a store placed at index q acts like a store at
+        # index q*(n-1)/n of the convolution; resample to match
+        for axis in range(2):
+            n = size[axis]
+            position = np.arange(n) * (n - 1) / n
+            lower = np.floor(position).astype(int)
+            upper = np.minimum(lower + 1, n - 1)
+            fraction = position - lower
+            shape = [1, 1]
+            shape[axis] = n
+            fraction = fraction.reshape(shape)
+            gain = ((1 - fraction) * np.take(gain, lower, axis=axis)
+                    + fraction * np.take(gain, upper, axis=axis))
+        return np.maximum(gain, 0) * profit_per_customer
+
+    def _extends_known_stores(self, stores: Dict[int, List[Store]]) -> bool:
+        if list(stores)[:len(self._stores)] != list(self._stores):
+            return False
+        for player_id, known_stores in self._stores.items():
+            player_stores = stores[player_id]
+            if len(player_stores) < len(known_stores):
+                return False
+            if known_stores and player_stores[len(known_stores)-1] is not known_stores[-1]:
+                return False
+        return True
+
+    def _update_total(self, window):
+        if not self._owns_total:
+            self.total_attractiveness = self.total_attractiveness.copy()
+            self._owns_total = True
+        # Summed in player order, exactly as attractiveness_allocation does
+        total_attractiveness = np.zeros(self.total_attractiveness[window].shape,
+                                        self.total_attractiveness.dtype)
+        for best_attractiveness in self.best_attractiveness.values():
+            total_attractiveness += best_attractiveness[window]
+        self.total_attractiveness[window] = total_attractiveness
+
+
+class StoreHistory:
+    """
+    Store locations of every player for each round of a game.
+
+    Indexing works like a list of {player_id: [Store]} dicts, one entry per
+    round, but since rounds only ever add stores, each player's stores are
+    kept in a single list and every round only records how many of them
+    existed at the time.
+    """
+    def __init__(self):
+        self._stores: Dict[int, List[Store]] = {}
+        self._ranges: List[Dict[int, Tuple[int, int]]] = []
+
+    def append(self, stores: Dict[int, List[Store]]):
+        """ Record the complete store lists of every player for a new round
+        """
+        previous = self._ranges[-1] if self._ranges else {}
+        ranges = {}
+        for player_id, player_stores in stores.items():
+            known_stores = self._stores.setdefault(player_id, [])
+            start, end = previous.get(player_id, (len(known_stores),
+                                                  len(known_stores)))
+            extends_previous = (
+                end == len(known_stores)
+                and len(player_stores) >= end - start
+                and (end == start
+                     or player_stores[end-start-1] is known_stores[end-1]))
+            if not extends_previous:
+                # Not a continuation of the previous round, start a new run
+                start = end = len(known_stores)
+            known_stores.extend(player_stores[end-start:])
+            ranges[player_id] = (start, len(known_stores))
+        self._ranges.append(ranges)
+
+    def copy(self) -> "StoreHistory":
+        """ Returns an independent copy of the history, in O(stores)
+        """
+        history = StoreHistory()
+        history._stores = {player_id: list(player_stores)
+                           for player_id, player_stores in self._stores.items()}
+        history._ranges = list(self._ranges)
+        return history
+
+    def round_token(self, round_number: int) -> object:
+        """ Returns an object identifying the given round of this history.
+        Copies of the history share the tokens of the rounds they copied, and
+        rounds appended later get new ones.
+        """
+        return self._ranges[self._index(round_number)]
+
+    def __getitem__(self, round_number: int) -> Dict[int, List[Store]]:
+        ranges = self._ranges[self._index(round_number)]
+        return {player_id: self._stores[player_id][start:end]
+                for player_id, (start, end) in ranges.items()}
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def __iter__(self):
+        for round_number in range(len(self)):
+            yield self[round_number]
+
+    def _index(self, round_number: int) -> int:
+        if round_number < 0:
+            round_number += len(self)
+        if not 0 <= round_number < len(self):
+            raise IndexError("round number out of range")
+        return round_number
+
+
+class StoreIndex:
+    """
+    Spatial index of stores, for nearest store and radius queries.
+
+    Stores are bucketed by position (store.pos) into a uniform grid of square
+    cells of cell_size grid units, so a query only looks at the stores in the
+    cells around the query point instead of at every store. Distances are
+    euclidian distances between positions. Every query has a batched version
+    taking an array of points, evaluated with numpy over all points at once.
+    """
+    def __init__(self, cell_size: float = 32):
+        self.cell_size = cell_size
+        self.stores: List[Store] = []
+        self.player_ids: List[int] = []
+        # Buckets in compressed form (positions sorted by cell, the store
+        # index of each, the start and count of every cell of the bounding
+        # box, its origin and the number of non-empty cells), rebuilt lazily
+        # after stores are added
+        self._buckets: Optional[Tuple[np.ndarray, ...]] = None
+
+    def add(self, player_id: int, store: Store):
+        """ Add a store of player_id to the index
+        """
+        self.stores.append(store)
+        self.player_ids.append(player_id)
+        self._buckets = None
+
+    def add_stores(self, stores: Dict[int, List[Store]]):
+        """ Add stores for each player, by id
+        """
+        for player_id, player_stores in stores.items():
+            for store in player_stores:
+                self.add(player_id, store)
+
+    def __len__(self) -> int:
+        return len(self.stores)
+
+    def copy(self) -> "StoreIndex":
+        """ Returns an independent copy of the index, in O(stores)
+        """
+        index = copy(self)
+        index.stores = list(self.stores)
+        index.player_ids = list(self.player_ids)
+        return index
+
+    def nearest(self, point) -> Optional[Tuple[float, int, Store]]:
+        """ Returns (distance, player_id, store) for the store closest to
+        point, or None if the index is empty
+        """
+        distances, indices = self.nearest_many([point])
+        if indices[0] < 0:
+            return None
+        return (float(distances[0]), self.player_ids[indices[0]],
+                self.stores[indices[0]])
+
+    def within(self, point, radius: float) -> List[Tuple[int, Store]]:
+        """ Returns (player_id, store) for every store closer than radius to
+        point
+        """
+        matches = []
+        for indices, distances, valid in self._neighbours(
+                np.asarray([point], dtype=float), radius):
+            for index in indices[valid & (distances < radius)]:
+                matches.append((self.player_ids[index], self.stores[index]))
+        return matches
+
+    def any_within(self, point, radius: float) -> bool:
+        """ Returns True if any store is closer than radius to point
+        """
+        return bool(self.any_within_many([point], radius)[0])
+
+    def count_within_many(self, points, radius: float) -> np.ndarray:
+        """ Returns the number of stores closer than radius to each of the
+        points, an array-like of (row, col) positions
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        counts = np.zeros(len(points), dtype=int)
+        for indices, distances, valid in self._neighbours(points, radius):
+            counts += valid & (distances < radius)
+        return counts
+
+    def any_within_many(self, points, radius: float) -> np.ndarray:
+        """ Returns a boolean array, True for each of the points (an
+        array-like of (row, col) positions) that has a store closer than
+        radius
+        """
+        return self.count_within_many(points, radius) > 0
+
+    def nearest_many(self, points) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns (distances, indices) with the distance to the closest
+        store and its index in self.stores and self.player_ids for each of
+        the points (an array-like of (row, col) positions). Indices are -1
+        (and distances inf) when the index is empty.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        best_distances = np.full(len(points), np.inf)
+        best_indices = np.full(len(points), -1)
+        if not self.stores:
+            return best_distances, best_indices
+
+        _, _, starts, _, origin, n_buckets = self._get_buckets()
+        cells = np.floor(points / self.cell_size).astype(int)
+        todo = np.arange(len(points))
+        # Rings closer than the bounding box of the stores are empty, and
+        # every store is found once the rings reach past it
+        box_distances = np.max(np.maximum(
+            np.maximum(origin - cells, 0),
+            np.maximum(cells - (origin + np.array(starts.shape) - 1), 0)),
+            axis=1)
+        first_ring = int(box_distances.min())
+        max_ring = int(np.max(np.maximum(
+            np.abs(cells - origin),
+            np.abs(cells - (origin + np.array(starts.shape) - 1))))) + 1
+
+        for ring in range(first_ring, max_ring + 1):
+            offsets = self._ring(ring, *self._offset_bounds(cells[todo]))
+            if len(offsets) > n_buckets:
+                # Cheaper to look at every store than at this many cells
+                for indices, distances, valid in self._all_stores(points[todo]):
+                    closer = distances < best_distances[todo]
+                    best_distances[todo[closer]] = distances[closer]
+                    best_indices[todo[closer]] = indices[closer]
+                break
+            for offset in offsets:
+                for indices, distances, valid in self._bucket_stores(
+                        points[todo], cells[todo] + offset):
+                    closer = valid & (distances < best_distances[todo])
+                    best_distances[todo[closer]] = distances[closer]
+                    best_indices[todo[closer]] = indices[closer]
+            # Stores in further rings are at least ring cells away
+            todo = todo[best_distances[todo] > ring * self.cell_size]
+            if len(todo) == 0:
+                break
+        return best_distances, best_indices
+
+    def _offset_bounds(self, cells) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns (low, high), the range of cell offsets that lead from any
+        of the cells into the bounding box of the stores
+        """
+        _, _, starts, _, origin, _ = self._get_buckets()
+        return (origin - cells.max(axis=0),
+                origin + np.array(starts.shape) - 1 - cells.min(axis=0))
+
+    def _ring(self, ring: int, low, high) -> List[Tuple[int, int]]:
+        """ Returns the cell offsets at chebyshev distance ring, within the
+        offset range [low, high]
+        """
+        rows = range(max(-ring, low[0]), min(ring, high[0]) + 1)
+        offsets = []
+        for dx in rows:
+            if abs(dx) == ring:
+                offsets.extend((dx, dy) for dy in range(max(-ring, low[1]),
+                                                        min(ring, high[1]) + 1))
+            else:
+                offsets.extend((dx, dy) for dy in (-ring, ring)
+                               if low[1] <= dy <= high[1])
+        return offsets
+
+    def _neighbours(self, points, radius: float):
+        """ Yields (indices, distances, valid) arrays over the points for the
+        stores in every cell that can hold a store within radius
+        """
+        if not self.stores or len(points) == 0:
+            return
+        cells = np.floor(points / self.cell_size).astype(int)
+        low, high = self._offset_bounds(cells)
+        reach = np.ceil(radius / self.cell_size)
+        rows = range(int(max(-reach, low[0])), int(min(reach, high[0])) + 1)
+        cols = range(int(max(-reach, low[1])), int(min(reach, high[1])) + 1)
+        if len(rows) * len(cols) > self._get_buckets()[5]:
+            # Cheaper to look at every store than at this many cells
+            yield from self._all_stores(points)
+            return
+        for dx in rows:
+            for dy in cols:
+                yield from self._bucket_stores(points, cells + (dx, dy))
+
+    def _all_stores(self, points):
+        """ Yields (indices, distances, valid) arrays over the points for
+        every store in turn
+        """
+        positions, order = self._get_buckets()[:2]
+        valid = np.ones(len(points), dtype=bool)
+        for index, position in zip(order, positions):
+            distances = np.sqrt(np.sum(np.square(position - points), axis=1))
+            yield np.full(len(points), index), distances, valid
+
+    def _bucket_stores(self, points, cells):
+        """ Yields (indices, distances, valid) arrays over the points, for
+        the j-th store of each point's cell in turn
+        """
+        positions, order, starts, counts, origin, _ = self._get_buckets()
+        local = cells - origin
+        inside = np.all((local >= 0) & (local < starts.shape), axis=1)
+        start = np.zeros(len(points), dtype=int)
+        count = np.zeros(len(points), dtype=int)
+        start[inside] = starts[local[inside, 0], local[inside, 1]]
+        count[inside] = counts[local[inside, 0], local[inside, 1]]
+        for j in range(int(count.max(initial=0))):
+            valid = j < count
+            index = np.where(valid, start + j, 0)
+            distances = np.sqrt(np.sum(np.square(positions[index] - points),
+                                       axis=1))
+            yield order[index], distances, valid
+
+    def _get_buckets(self):
+        if self._buckets is None:
+            positions = np.array([store.pos for store in self.stores],
+                                 dtype=float).reshape(-1, 2)
+            cells = np.floor(positions / self.cell_size).astype(int)
+            origin = cells.min(axis=0)
+            shape = cells.max(axis=0) - origin + 1
+            flat = np.ravel_multi_index((cells - origin).T, shape)
+            order = np.argsort(flat, kind="stable")
+            counts = np.bincount(flat, minlength=np.prod(shape))
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            self._buckets = (positions[order], order, starts.reshape(shape),
+                             counts.reshape(shape), origin,
+                             int(np.count_nonzero(counts)))
+        return self._buckets
+
+
+class AllocationHistory:
+    """
+    Allocations of every player for each round of a game.
+
+    Indexing works like a list of {player_id: np.ndarray} dicts, one entry per
+    round. The most recent round is always kept as computed. To save memory,
+    earlier rounds can be stored with a smaller dtype, and only the last
+    keep_rounds rounds are kept at all; anything that is no longer stored is
+    recomputed on demand with recompute(round_number).
+    """
+    def __init__(self, recompute, keep_rounds: Optional[int] = None,
+                 dtype=np.float64):
+        self.recompute = recompute
+        self.keep_rounds = keep_rounds
+        self.dtype = np.dtype(dtype)
+        self._rounds: List[Optional[Dict[int, np.ndarray]]] = []
+        self._compacted: List[bool] = []
+
+    def append(self, allocations: Optional[Dict[int, np.ndarray]]):
+        """ Record the allocations of a new round, compacting older rounds.
+        None records a round whose allocations are not kept at all.
+        """
+        if self._rounds and self._rounds[-1] is not None:
+            previous = self._rounds[-1]
+            if any(self.dtype.itemsize < allocation.dtype.itemsize
+                   for allocation in previous.values()):
+                self._rounds[-1] = {player_id: allocation.astype(self.dtype)
+                                    for player_id, allocation in previous.items()}
+                self._compacted[-1] = True
+        self._rounds.append(allocations)
+        self._compacted.append(False)
+
+        if self.keep_rounds is not None:
+            for round_number in range(len(self._rounds) - max(self.keep_rounds, 1)):
+                self._rounds[round_number] = None
+
+    def copy(self, recompute=None) -> "AllocationHistory":
+        """ Returns a copy of the history, recomputing rounds that are not
+        stored with recompute (by default the same as this history). The
+        allocations themselves are never modified, so they are shared.
+        """
+        history = copy(self)
+        if recompute is not None:
+            history.recompute = recompute
+        history._rounds = list(self._rounds)
+        history._compacted = list(self._compacted)
+        return history
+
+    def exact(self, round_number: int) -> Dict[int, np.ndarray]:
+        """ Returns the allocations for the given round as they were
+        originally computed, recomputing them if they have been compacted
+        """
+        round_number = self._index(round_number)
+        if self._compacted[round_number]:
+            return self.recompute(round_number)
+        return self[round_number]
+
+    def __getitem__(self, round_number: int) -> Dict[int, np.ndarray]:
+        round_number = self._index(round_number)
+        allocations = self._rounds[round_number]
+        if allocations is None:
+            return self.recompute(round_number)
+        return allocations
+
+    def __len__(self) -> int:
+        return len(self._rounds)
+
+    def __iter__(self):
+        for round_number in range(len(self)):
+            yield self[round_number]
+
+    def _index(self, round_number: int) -> int:
+        if round_number < 0:
+            round_number += len(self)
+        if not 0 <= round_number < len(self):
+            raise IndexError("round number out of range")
+        return round_number
+
+
 class PlayerTimedOutError(RuntimeError):
     pass
 
@@ -322,6 +1792,191 @@ def timeout_handler(signum, frame):
     raise PlayerTimedOutError()
 
 
+class PlayerProcessError(RuntimeError):
+    pass
+
+
+def _player_worker(connection, player_class, player_id, config,
+                   map_attributes, shared_map_name, shape, dtype, seed):
+    """ Hosts a player in a worker process, see ProcessPlayer
+    """
+    # Forked workers don't keep the parent's random state, seed them from it
+    # so seeded games stay reproducible
+    random.seed(seed)
+    np.random.seed(seed)
+    shared_map = shared_memory.SharedMemory(name=shared_map_name)
+    slmap = SiteLocationMap.__new__(SiteLocationMap)
+    slmap.__dict__.update(map_attributes)
+    slmap._cache = {}
+    slmap._population_distribution = np.ndarray(shape, dtype,
+                                                buffer=shared_map.buf)
+    slmap._population_distribution.flags.writeable = False
+
+    try:
+        player = player_class(player_id, config)
+    except Exception as e:
+        connection.send(("error", None, repr(e)))
+        return
+    connection.send(("ready", player.name, player.color))
+    # Kept up to date from the observed stores, like the game's index
+    player.store_index = StoreIndex()
+
+    store_locations: Dict[int, List[Store]] = {}
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message[0] == "close":
+            break
+
+        _, request_id, new_stores, observed_stores, current_funds = message
+        for player_id, (replace, stores) in new_stores.items():
+            previous_stores = [] if replace else store_locations.get(player_id, [])
+            store_locations[player_id] = previous_stores + stores
+
+        player.stores_to_place = []
+        error = None
+        try:
+            if observed_stores is not None:
+                player.store_index.add_stores(observed_stores)
+                player.observe_stores(observed_stores)
+            player.place_stores(slmap.read_only_view(), store_locations,
+                                current_funds)
+        except Exception as e:
+            error = repr(e)
+        connection.send(("stores", request_id, (player.stores_to_place, error)))
+
+    del slmap
+    shared_map.close()
+
+
+class ProcessPlayer(SiteLocationPlayer):
+    """
+    Runs a player in a long-lived worker process.
+
+    The population map is shared with the worker through shared memory once,
+    and every round only the stores placed since the previous round are sent
+    over a pipe. place_stores waits for the reply until the
+    place_stores_time_s deadline; late replies are abandoned (and discarded
+    when they eventually arrive), so a slow player can never hold up the game.
+
+    Unlike players run in the game's process, a player that times out places
+    no stores at all: whatever it had already put in stores_to_place is still
+    in the worker when the deadline passes.
+
+    The worker's random and np.random generators are seeded from the game
+    process's random state when the worker starts, so seeded games play the
+    same way every time.
+    """
+
+    def __init__(self, player_class: type, player_id: int, config: Dict,
+                 slmap: SiteLocationMap,
+                 shared_map: "shared_memory.SharedMemory"):
+        super().__init__(player_id, config)
+        self.player_class = player_class
+        self._connection, worker_connection = multiprocessing.Pipe()
+        # The population is shared through shared_map, and the values
+        # derived from it are recomputed by the worker as needed
+        map_attributes = {key: value for key, value in vars(slmap).items()
+                          if key not in ("_population_distribution", "_cache")}
+        self._process = multiprocessing.Process(
+            target=_player_worker,
+            args=(worker_connection, player_class, player_id, config,
+                  map_attributes, shared_map.name,
+                  slmap.population_distribution.shape,
+                  slmap.population_distribution.dtype,
+                  random.getrandbits(32)),
+            daemon=True)
+        self._process.start()
+        worker_connection.close()
+
+        self._request_id = 0
+        self._sent_stores: Dict[int, List[Store]] = {}
+        self._observed_stores: Optional[Dict[int, List[Store]]] = None
+
+        try:
+            message = self._receive(time.time() + config["place_stores_time_s"])
+        except (PlayerTimedOutError, PlayerProcessError):
+            self.close()
+            raise
+        if message[0] == "error":
+            self.close()
+            raise PlayerProcessError(f"{player_class.__name__} failed to start: {message[2]}")
+        _, self.name, self.color = message
+
+    def place_stores(self, slmap: SiteLocationMap,
+                     store_locations: Dict[int, List[Store]],
+                     current_funds: float):
+        self.request_stores(store_locations, current_funds)
+        self.collect_stores(time.time() + self.config["place_stores_time_s"])
+
+    def observe_stores(self, new_stores: Dict[int, List[Store]]):
+        # Passed on to the worker with the next request
+        self._observed_stores = new_stores
+
+    def request_stores(self, store_locations: Dict[int, List[Store]],
+                       current_funds: float):
+        """ Ask the worker to place stores, without waiting for the reply
+        """
+        new_stores = {}
+        for player_id, stores in store_locations.items():
+            sent_stores = self._sent_stores.get(player_id, [])
+            replace = not (len(stores) >= len(sent_stores)
+                           and (not sent_stores
+                                or stores[len(sent_stores)-1] is sent_stores[-1]))
+            new_stores[player_id] = (replace,
+                                     stores if replace else stores[len(sent_stores):])
+            self._sent_stores[player_id] = list(stores)
+
+        observed_stores, self._observed_stores = self._observed_stores, None
+        self._request_id += 1
+        self.stores_to_place = []
+        try:
+            self._connection.send(("place_stores", self._request_id,
+                                   new_stores, observed_stores, current_funds))
+        except (BrokenPipeError, OSError) as e:
+            raise PlayerProcessError(f"Worker for {self.name} is not running") from e
+
+    def collect_stores(self, deadline: float):
+        """ Wait until deadline (a time.time() value) for the reply to the
+        last request and set self.stores_to_place from it.
+
+        Raises PlayerTimedOutError if the reply does not arrive in time.
+        """
+        while True:
+            message = self._receive(deadline)
+            if message[1] != self._request_id:
+                # Late reply to a request that already timed out
+                continue
+            stores, error = message[2]
+            if error is not None:
+                raise PlayerProcessError(f"{self.name} raised {error} in place_stores")
+            self.stores_to_place = stores
+            return
+
+    def close(self):
+        """ Stop the worker process
+        """
+        try:
+            self._connection.send(("close",))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._connection.close()
+
+    def _receive(self, deadline: float):
+        try:
+            if not self._connection.poll(max(deadline - time.time(), 0)):
+                raise PlayerTimedOutError()
+            return self._connection.recv()
+        except (EOFError, OSError) as e:
+            raise PlayerProcessError(f"Worker for {self.name} stopped") from e
+
+
 class SiteLocationGame:
     """
     Class controlling the site location game.
@@ -338,107 +1993,286 @@ class SiteLocationGame:
         # Note - all of the below attributes follow the same pattern of being
         # lists, where each entry represents the state during a given round
         # i.e. self.store_locations[3] will return the stores for each player
-        # as they were on the 3rd round
+        # as they were on the 3rd round. store_locations and allocations are
+        # compact list-like histories, see StoreHistory and AllocationHistory
         log.info("Initializing Map")
         self.slmaps = [SiteLocationMap(
             config["map_size"], 
-            population=config["population"])]
+            seed=config.get("map_seed"),
+            population=config["population"],
+            cache_dir=config.get("map_cache_dir"),
+            dtype=config.get("numeric_dtype", "float64"))]
+
+        # The built-in attractiveness allocation keeps its fields between
+        # rounds, so each round only pays for the newly placed stores
+        self.allocation_engine: Optional[AttractivenessAllocationEngine] = None
+        if allocation_func is attractiveness_allocation:
+            self.allocation_engine = AttractivenessAllocationEngine(
+                self.slmaps[0], config["store_config"])
         
+        # With player_sandbox, every player runs in its own worker process
+        # and gets the population map through shared memory
+        self._shared_map: Optional[shared_memory.SharedMemory] = None
+        if config.get("player_sandbox", False):
+            population = self.slmaps[0].population_distribution
+            self._shared_map = shared_memory.SharedMemory(
+                create=True, size=max(population.nbytes, 1))
+            np.ndarray(population.shape, population.dtype,
+                       buffer=self._shared_map.buf)[...] = population
+
         log.info("Initializing Players")
         self.players: Dict[int, SiteLocationPlayer] = {}
-        self.store_locations: List[Dict[int, List[Store]]] = [{}]
-        self.allocations: List[Dict[int, np.ndarray]] = [{}]
+        self.store_locations = StoreHistory()
+        # Every store placed so far, for nearest store and radius queries,
+        # shared with the players (see SiteLocationPlayer)
+        self.store_index = StoreIndex()
+        self.allocations = AllocationHistory(
+            self._recompute_allocations,
+            keep_rounds=config.get("history_rounds"),
+            dtype=config.get("history_dtype", "float64"))
         self.scores: List[Dict[int, float]] = [{}]
-
+        self._next_store_id = 0
+        self.hooks: List = []
+        # With concurrent_players, the place_stores calls of players on
+        # threads, and the stores they have not observed while still busy
+        # with an earlier call
+        self._running_players: Dict[int, Future] = {}
+        self._unobserved_stores: Dict[int, Dict[int, List[Store]]] = {}
+        # Forks share the players (and shared map) of the game they were
+        # forked from, and leave closing them to it
+        self._owns_players = True
+
+        initial_stores: Dict[int, List[Store]] = {}
+        initial_allocations: Dict[int, np.ndarray] = {}
         for i, player_class in enumerate(player_classes):
             try:
-                self.players[i] = player_class(i, config)
+                if self._shared_map is not None:
+                    self.players[i] = ProcessPlayer(player_class, i, config,
+                                                    self.slmaps[0],
+                                                    self._shared_map)
+                else:
+                    self.players[i] = player_class(i, config)
             except Exception as e:
                 log.error(f"Failed to instantiate player {i}")
-            self.store_locations[0][i] = []
-            self.allocations[0][i] = np.zeros(config["map_size"])
+            initial_stores[i] = []
+            initial_allocations[i] = np.zeros(config["map_size"],
+                                              self.slmaps[0].dtype)
             self.scores[0][i] = config["starting_cash"]
+        self.store_locations.append(initial_stores)
+        # The last round the players observed, as (round number, round_token)
+        self._players_round = (0, self.store_locations.round_token(0))
+        self.allocations.append(None if config.get("score_only", False)
+                                else initial_allocations)
 
         self.current_round = 0
 
+    def fork(self) -> "SiteLocationGame":
+        """Returns a copy of the game in its current state, e.g. to play
+        hypothetical rounds with play_round(placements) for a lookahead
+        search. Playing rounds on either game does not affect the other.
+
+        The map, the allocations of past rounds and the attractiveness fields
+        are shared, the fields copy on write, so forking costs O(stores)
+        rather than O(map size * rounds). The players belong to the original
+        game, so rounds of a fork can only be played with placements.
+        """
+        game = copy(self)
+        game.__dict__.update(self._copy_state(game))
+        game.hooks = list(self.hooks)
+        game._owns_players = False
+        return game
+
+    def snapshot(self) -> Dict[str, object]:
+        """Returns the state of the game, to be restored with restore. Like
+        fork, this costs O(stores).
+        """
+        return self._copy_state(self)
+
+    def restore(self, snapshot: Dict[str, object]):
+        """Return the game to the state of the given snapshot (from this
+        game's snapshot). The snapshot can be restored again later.
+
+        The players are not restored. If they have observed rounds played
+        after the snapshot, the game can then only be continued with
+        placements.
+        """
+        self.__dict__.update(self._copy_state(self, snapshot))
+
+    def _copy_state(self, game: "SiteLocationGame",
+                    state: Optional[Dict[str, object]] = None
+                    ) -> Dict[str, object]:
+        """Returns a copy of the attributes that change as rounds are played
+        (of state, by default of this game), for game
+        """
+        if state is None:
+            state = vars(self)
+        return {
+            "slmaps": list(state["slmaps"]),
+            "allocation_engine": (None if state["allocation_engine"] is None
+                                  else state["allocation_engine"].fork()),
+            "store_locations": state["store_locations"].copy(),
+            "store_index": state["store_index"].copy(),
+            "allocations": state["allocations"].copy(
+                game._recompute_allocations),
+            "scores": list(state["scores"]),
+            "current_round": state["current_round"],
+            "timeouts": state["timeouts"],
+            "store_type_error": state["store_type_error"],
+            "out_of_bounds_error": state["out_of_bounds_error"],
+            "_next_store_id": state["_next_store_id"],
+        }
+
     def play(self):
         """Plays a full site location game, returns the winning 
         SiteLocationPlayer object.
         """
         log.info("Starting game")
-        for i in range(self.config["n_rounds"]):
-            self.play_round()
+        try:
+            for i in range(self.config["n_rounds"]):
+                self.play_round()
+        finally:
+            self.close()
         log.info(f"Winner: {self.winner().name}")
         return self.winner()
+
+    def add_hook(self, hook):
+        """Register hook to be called with the timing of every phase of the
+        game, as a dict with:
+        - phase: "round", "place_stores", "valid_stores", "allocation",
+          "round_score" or "render"
+        - round: round number
+        - player_id: id of the player for per-player phases, otherwise None
+        - start: time.time() at the start of the phase
+        - elapsed: duration of the phase in seconds
+
+        Phases are reported when they end, so a round is reported after the
+        phases it contains. See ChromeTraceRecorder.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _emit(self, phase, start, elapsed, player_id=None, round_number=None):
+        if round_number is None:
+            round_number = self.current_round
+        for hook in self.hooks:
+            hook({"phase": phase, "round": round_number,
+                  "player_id": player_id, "start": start,
+                  "elapsed": elapsed})
+
+    @contextmanager
+    def _phase(self, phase, player_id=None, round_number=None):
+        """Time the body of the with statement as phase, for the hooks
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            if self.hooks:
+                self._emit(phase, start, time.time() - start, player_id,
+                           round_number)
+
+    def close(self):
+        """Stop any player worker processes and release the shared map
+        """
+        if not self._owns_players:
+            return
+        for player in self.players.values():
+            if isinstance(player, ProcessPlayer):
+                player.close()
+        if self._shared_map is not None:
+            self._shared_map.close()
+            self._shared_map.unlink()
+            self._shared_map = None
                        
-    def play_round(self):
+    def play_round(self, placements: Optional[Dict[int, List[Store]]] = None):
         """Plays a single round of the site location game
+
+        If placements (the stores each player places, by id) is given, the
+        players are not asked to place stores, see fork. The next time they
+        are, they observe the stores of every round they did not see.
+
+        Raises RuntimeError if placements is None but the players can't play
+        this game: it is a fork, or it was restored to a state before rounds
+        the players have already observed.
         """
+        if placements is None:
+            self._check_players_round()
         self.current_round += 1
         log.info(f"Starting round {self.current_round}")
+        with self._phase("round"):
+            self._play_round(placements)
+
+    def _play_round(self, placements: Optional[Dict[int, List[Store]]] = None):
+        # The map does not change between rounds, so every round shares the
+        # same map object and players get a write protected view of it
+        self.slmaps.append(self.slmaps[-1])
+
+        previous_stores = self.store_locations[-1]
+        if placements is not None:
+            placed_stores = {player_id: list(placements.get(player_id, []))
+                             for player_id in self.players}
+        else:
+            # Everything placed since the players last played
+            seen_stores = self.store_locations[self._players_round[0]]
+            new_stores = {player_id: stores[len(seen_stores.get(player_id, [])):]
+                          for player_id, stores in previous_stores.items()}
+            self._players_round = (len(self.store_locations) - 1,
+                                   self.store_locations.round_token(-1))
+            if self.config.get("concurrent_players", False):
+                placed_stores = self._place_stores_concurrently(
+                    previous_stores, new_stores)
+            else:
+                placed_stores = {}
+                for player_id, player in self.players.items():
+                    placed_stores[player_id] = self._place_stores(
+                        player, previous_stores, new_stores)
 
-        self.slmaps.append(deepcopy(self.slmaps[-1]))
-
-        self.store_locations.append({})
+        # Stores are applied in player id order, whichever way they were placed
+        round_stores = {}
         store_costs = {}
         for player_id, player in self.players.items():
             prev_score = self.scores[-1][player_id]
-            player.stores_to_place = []
-            try:
-                signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(self.config["place_stores_time_s"])
-            except AttributeError:
-                # We're on windows, so we can't use SIGALRM to limit execution 
-                # time
-                pass
-            start_time = time.time()
-            if self.config["ignore_player_exceptions"]:
-                try:
-                    player.place_stores(deepcopy(self.slmaps[-1]), 
-                                        self.store_locations[-2], 
-                                        prev_score)
-                    signal.alarm(0) # clear current alarm
-                except PlayerTimedOutError:
-                    log.warn(f"Player {player.name} timed out placing stores")
-                    self.timeouts += 1
-                    new_stores = player.stores_to_place
-                except Exception as e:
-                    log.warn(f"Player {player.name} raised exception in place_stores")
-                    new_stores = []
-            else:
-                player.place_stores(deepcopy(self.slmaps[-1]), 
-                                    self.store_locations[-2], 
-                                    prev_score)
-                signal.alarm(0) # clear current alarm
-
-            elapsed = time.time() - start_time
-            if elapsed > self.config["place_stores_time_s"]:
-                log.warn(f"Player {player.name} exceeded time limit placing stores {elapsed:.2f}")
-            else:
-                log.debug(f"Player {player.name} took {elapsed:.2f}s to place stores")
+            new_stores = placed_stores[player_id]
 
-            new_stores = player.stores_to_place
-
-            valid_stores = self.valid_stores(new_stores, prev_score)
+            with self._phase("valid_stores", player_id):
+                valid_stores = self.valid_stores(new_stores, prev_score)
             for store in valid_stores:
                 log.debug(f"Player {player.name} placed a {store.store_type} store at {store.pos}")
             if new_stores != valid_stores:
                 log.debug(f"Player {player.name} attempted to place {len(new_stores)} store(s), but was only able to place {len(valid_stores)}")
             else:
                 log.debug(f"Player {player.name} placed {len(new_stores)} store(s)")
-            new_stores = valid_stores
+            new_stores = self._record_stores(valid_stores)
+            for store in new_stores:
+                self.store_index.add(player_id, store)
 
-            all_stores = self.store_locations[-2][player_id] + new_stores
-            self.store_locations[-1][player_id] = all_stores
+            all_stores = previous_stores[player_id] + new_stores
+            round_stores[player_id] = all_stores
             store_costs[player_id] = self.store_cost(new_stores, all_stores)
-
-        allocations = self.allocation_func(
-            self.slmaps[-1], 
-            self.store_locations[-1],
-            self.config["store_config"])
-        self.allocations.append(allocations)
-
-        round_score = self.round_score()
+        self.store_locations.append(round_stores)
+
+        if self.config.get("score_only", False):
+            # Scores straight from the attractiveness fields, the allocations
+            # are only recomputed if they are asked for
+            self.allocations.append(None)
+            with self._phase("round_score"):
+                round_score = self._score_only_round(round_stores)
+        else:
+            with self._phase("allocation"):
+                if self.allocation_engine is not None:
+                    self.allocation_engine.update(round_stores)
+                    allocations = self.allocation_engine.allocations()
+                else:
+                    allocations = self.allocation_func(
+                        self.slmaps[-1], 
+                        round_stores,
+                        self.config["store_config"])
+            self.allocations.append(allocations)
+
+            with self._phase("round_score"):
+                round_score = self.round_score()
         self.scores.append({})
         for player_id, player in self.players.items():
             prev_score = self.scores[-2][player_id]
@@ -449,6 +2283,204 @@ class SiteLocationGame:
             self.scores[-1][player_id] = current_score
             log.info(f"Player {player.name} has ${current_score:.2f}")
 
+    def _score_only_round(self, round_stores: Dict[int, List[Store]]
+                          ) -> Dict[int, float]:
+        """Returns the revenue of each player in the round with the given
+        stores, without keeping the allocations (see the score_only option)
+        """
+        profit_per_customer = self.config["profit_per_customer"]
+        if self.allocation_engine is not None:
+            self.allocation_engine.update(round_stores)
+            revenues = self.allocation_engine.revenues(profit_per_customer)
+        else:
+            allocations = self.allocation_func(self.slmaps[-1],
+                                               round_stores,
+                                               self.config["store_config"])
+            population = self.slmaps[-1].population_distribution
+            revenues = {player_id: np.sum(population * allocation,
+                                          dtype=np.float64)
+                        * profit_per_customer
+                        for player_id, allocation in allocations.items()}
+        return {player_id: revenues[player_id] for player_id in self.players}
+
+    def _check_players_round(self):
+        """Raise RuntimeError unless the players' view of the game is a
+        previous state of this game
+        """
+        if not self._owns_players:
+            raise RuntimeError("The players belong to the game this one was "
+                               "forked from, play rounds with placements")
+        round_number, token = self._players_round
+        if (round_number >= len(self.store_locations)
+                or self.store_locations.round_token(round_number) is not token):
+            raise RuntimeError("The players have observed rounds that are not "
+                               "part of this game since it was restored, play "
+                               "rounds with placements")
+
+    def _record_stores(self, stores: List[Store]) -> List[Store]:
+        """Returns copies of the accepted stores with new store ids, so the
+        recorded stores can't be changed or reused by players afterwards
+        """
+        recorded = []
+        for store in stores:
+            recorded.append(Store(store.pos, store.store_type,
+                                  self._next_store_id))
+            self._next_store_id += 1
+        return recorded
+
+    def _place_stores(self, player, previous_stores,
+                      new_stores) -> List[Store]:
+        """Call observe_stores and place_stores for a single player, enforcing
+        the time limit with SIGALRM (where available). Returns the stores the
+        player asked to place.
+        """
+        prev_score = self.scores[-1][player.player_id]
+        player.stores_to_place = []
+        try:
+            # Sandboxed players enforce their own deadline
+            if not isinstance(player, ProcessPlayer):
+                signal.signal(signal.SIGALRM, timeout_handler)
+                signal.alarm(self.config["place_stores_time_s"])
+        except AttributeError:
+            # We're on windows, so we can't use SIGALRM to limit execution 
+            # time
+            pass
+        start_time = time.time()
+
+        def place_stores():
+            try:
+                player.store_index = self.store_index
+                player.observe_stores(new_stores)
+                player.place_stores(self.slmaps[-1].read_only_view(), 
+                                    previous_stores, 
+                                    prev_score)
+            finally:
+                try:
+                    signal.alarm(0) # clear current alarm
+                except AttributeError:
+                    pass
+
+        self._handle_player_errors(player, place_stores)
+        self._log_elapsed(player, start_time, time.time() - start_time)
+        return player.stores_to_place
+
+    def _place_stores_concurrently(self, previous_stores,
+                                   new_stores) -> Dict[int, List[Store]]:
+        """Run place_stores for all players at the same time, sandboxed
+        players in their worker processes and the others on threads, with a
+        shared deadline. Returns the stores each player asked to place, by id.
+
+        Threads can't be interrupted, so a player that runs over the deadline
+        keeps running in the background and only the stores it had chosen at
+        the deadline are used. Until that call returns, the player is skipped
+        (and counted as timed out) in later rounds, and the stores it did not
+        observe are passed to observe_stores the next time it plays.
+
+        Because of the GIL, players on threads only run at the same time
+        while they are in code that releases it (such as numpy); pure python
+        players need player_sandbox to overlap.
+        """
+        start_time = time.time()
+        deadline = start_time + self.config["place_stores_time_s"]
+        finished: Dict[int, float] = {}
+
+        def place_stores(player, prev_score, observed_stores, store_index):
+            player.store_index = store_index
+            player.observe_stores(observed_stores)
+            player.place_stores(self.slmaps[-1].read_only_view(),
+                                previous_stores,
+                                prev_score)
+            finished[player.player_id] = time.time()
+
+        pool = ThreadPoolExecutor(max_workers=max(len(self.players), 1))
+        futures = {}
+        busy = set()
+        for player_id, player in self.players.items():
+            prev_score = self.scores[-1][player_id]
+            if isinstance(player, ProcessPlayer):
+                player.stores_to_place = []
+                player.observe_stores(new_stores)
+                futures[player_id] = pool.submit(player.request_stores,
+                                                 previous_stores, prev_score)
+                continue
+
+            observed_stores = {
+                store_player_id: (self._unobserved_stores.get(player_id, {})
+                                  .get(store_player_id, []) + stores)
+                for store_player_id, stores in new_stores.items()}
+            running = self._running_players.get(player_id)
+            if running is not None and not running.done():
+                # Still placing stores for an earlier round
+                self._unobserved_stores[player_id] = observed_stores
+                busy.add(player_id)
+                continue
+            self._unobserved_stores.pop(player_id, None)
+            player.stores_to_place = []
+            # A copy, as the player may still be running when the game adds
+            # this round's stores to its index
+            futures[player_id] = pool.submit(place_stores, player,
+                                             prev_score, observed_stores,
+                                             self.store_index.copy())
+            self._running_players[player_id] = futures[player_id]
+        pool.shutdown(wait=False)
+
+        def wait(player_id, player):
+            try:
+                futures[player_id].result(max(deadline - time.time(), 0))
+            except FutureTimeoutError:
+                raise PlayerTimedOutError()
+            if isinstance(player, ProcessPlayer):
+                player.collect_stores(deadline)
+                finished[player_id] = time.time()
+
+        placed_stores = {}
+        for player_id, player in self.players.items():
+            if player_id in busy:
+                log.warn(f"Player {player.name} is still placing stores for an earlier round, skipping it")
+                self.timeouts += 1
+                placed_stores[player_id] = []
+                continue
+            self._handle_player_errors(player, lambda: wait(player_id, player))
+            placed_stores[player_id] = list(player.stores_to_place)
+            elapsed = finished.get(player_id, time.time()) - start_time
+            self._log_elapsed(player, start_time, elapsed)
+        return placed_stores
+
+    def _handle_player_errors(self, player, place_stores):
+        """Call place_stores(), logging and counting time outs and exceptions
+        unless the configuration says to raise them
+        """
+        if self.config["ignore_player_exceptions"]:
+            try:
+                place_stores()
+            except PlayerTimedOutError:
+                log.warn(f"Player {player.name} timed out placing stores")
+                self.timeouts += 1
+            except Exception as e:
+                log.warn(f"Player {player.name} raised exception in place_stores")
+        else:
+            place_stores()
+
+    def _log_elapsed(self, player, start_time, elapsed):
+        self._emit("place_stores", start_time, elapsed, player.player_id)
+        if elapsed > self.config["place_stores_time_s"]:
+            log.warn(f"Player {player.name} exceeded time limit placing stores {elapsed:.2f}")
+        else:
+            log.debug(f"Player {player.name} took {elapsed:.2f}s to place stores")
+
+    def _recompute_allocations(self, round_number):
+        """Recompute the allocations of a round that is no longer stored in
+        full in self.allocations
+        """
+        stores = self.store_locations[round_number]
+        if round_number == 0:
+            return {player_id: np.zeros(self.config["map_size"],
+                                        self.slmaps[0].dtype)
+                    for player_id in stores}
+        return self.allocation_func(self.slmaps[round_number],
+                                    stores,
+                                    self.config["store_config"])
+
     def valid_stores(self, new_stores, current_score):
         """Returns the list of stores in new_stores that can be afforded with
         current_score. Also limits the max number of stores by the self.config
@@ -488,12 +2520,17 @@ class SiteLocationGame:
 
     def round_score(self, round_number=-1):
         """Return the amount of revenue earned by each player in the given round
+
+        Revenue is always summed in float64, whatever the numeric_dtype, and
+        from the exact allocations of the round, whatever the history options.
         """
+        allocations = self.allocations.exact(round_number)
         scores = {}
         for player_id in self.players:
             new_score = np.sum(
                 self.slmaps[round_number].population_distribution * 
-                self.allocations[round_number][player_id]
+                allocations[player_id],
+                dtype=np.float64
             ) * self.config["profit_per_customer"]
             scores[player_id] = new_score
         return scores
@@ -526,18 +2563,65 @@ class SiteLocationGame:
         """
         slmap = self.slmaps[round_number]
         stores = self.store_locations[round_number]
-        allocations = self.allocations[round_number]
+        allocations = self.allocations.exact(round_number)
 
         slmap.save_image(filename, 
                          players=self.players,
                          stores=stores, 
                          allocations=allocations)
 
-    def save_game_report(self, dirname):
+    def save_images(self, dirname, rounds, workers=None):
+        """Save the image of each of the given rounds in dirname, rendered in
+        parallel on workers processes (by default one per core)
+        """
+        colors = {player_id: player.color
+                  for player_id, player in self.players.items()}
+
+        def jobs():
+            for round_number in rounds:
+                filename = os.path.join(dirname,
+                                        f"map-round-{round_number:02}.png")
+                slmap = self.slmaps[round_number]
+                yield (round_number,
+                       filename,
+                       None if slmap is self.slmaps[0] else slmap,
+                       colors,
+                       self.store_locations[round_number],
+                       self.allocations.exact(round_number))
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(rounds) <= 1:
+            _init_render_worker(self.slmaps[0])
+            for job in jobs():
+                self._emit("render", *_render_round(job), round_number=job[0])
+            _init_render_worker(None)
+            return
+
+        # Submit a few jobs per worker at a time, so allocations that are
+        # recomputed for the report don't all have to be in memory at once
+        with ProcessPoolExecutor(workers, initializer=_init_render_worker,
+                                 initargs=(self.slmaps[0],)) as pool:
+            max_pending = 2 * workers
+            pending = []
+            for job in jobs():
+                pending.append((job[0], pool.submit(_render_round, job)))
+                if len(pending) >= max_pending:
+                    round_number, future = pending.pop(0)
+                    self._emit("render", *future.result(),
+                               round_number=round_number)
+            for round_number, future in pending:
+                self._emit("render", *future.result(),
+                           round_number=round_number)
+
+    def save_game_report(self, dirname, rounds=None, workers=None):
         """Create a game report directory with the following contents:
         - images of each round
         - plots of score/time
         - markdown report with game details/configuration
+
+        rounds limits the round images to the given round numbers (by default
+        every round). The images are rendered in parallel on workers processes
+        (by default one per core); workers=1 renders them in this process.
         """
         log.info(f"Saving game report to: {dirname}")
         try:
@@ -548,10 +2632,9 @@ class SiteLocationGame:
         os.makedirs(dirname)
 
         # save each round image
-        for round_number in range(self.current_round+1):
-            round_image_filename = os.path.join(
-                dirname, f"map-round-{round_number:02}.png")
-            self.save_image(round_image_filename, round_number)
+        if rounds is None:
+            rounds = range(self.current_round+1)
+        self.save_images(dirname, rounds, workers)
 
         # Plot scores over time
         fig, ax = plt.subplots()
@@ -589,6 +2672,75 @@ class SiteLocationGame:
             f.write(f"{self.winner().name}\n")
 
 
+class ChromeTraceRecorder:
+    """
+    Game hook recording the phases of a game, see SiteLocationGame.add_hook.
+
+    save() writes them in the Chrome trace event format, which can be opened
+    in chrome://tracing or https://ui.perfetto.dev. Per-player phases are
+    shown on one row per player, the other phases on a "game" row.
+    """
+    def __init__(self):
+        self.events: List[Dict] = []
+
+    def __call__(self, event: Dict):
+        self.events.append(event)
+
+    def trace_events(self) -> List[Dict]:
+        """ Returns the recorded phases as a list of trace events
+        """
+        trace_events = []
+        rows = {None: "game"}
+        for event in self.events:
+            player_id = event["player_id"]
+            if player_id not in rows:
+                rows[player_id] = f"player {player_id}"
+            trace_events.append({
+                "name": event["phase"],
+                "cat": "site_location",
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["elapsed"] * 1e6,
+                "pid": 0,
+                "tid": 0 if player_id is None else player_id + 1,
+                "args": {"round": event["round"]},
+            })
+        for player_id, name in rows.items():
+            trace_events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": 0 if player_id is None else player_id + 1,
+                "args": {"name": name},
+            })
+        return trace_events
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.trace_events(),
+                       "displayTimeUnit": "ms"}, f)
+
+
+_render_map: Optional[SiteLocationMap] = None
+
+
+def _init_render_worker(slmap):
+    global _render_map
+    _render_map = slmap
+
+
+def _render_round(job):
+    """ Render one round image for SiteLocationGame.save_images, returns the
+    time.time() it started at and how long it took
+    """
+    start = time.time()
+    _, filename, slmap, colors, stores, allocations = job
+    if slmap is None:
+        slmap = _render_map
+    slmap.render_image(colors, stores, allocations).save(filename)
+    return start, time.time() - start
+
+
 def import_player(player_str):
     """Return the requested class
     
@@ -601,6 +2753,92 @@ def import_player(player_str):
     return getattr(mod, classname)
 
 
+def simulate_game(player_strs: List[str],
+                  config: Dict = DEFAULT_CONFIGURATION,
+                  seed: Optional[int] = None,
+                  report_dir: Optional[str] = None,
+                  trace_file: Optional[str] = None) -> Dict:
+    """Play a full game without any interaction and return its results as a
+    json serializable dict: the funds and number of stores of every player
+    after each round, the time each round took and the winner. Players are
+    listed in the order they were given, with None for players that failed
+    to load.
+
+    Arguments:
+    - player_strs: <module>:<class> strings of the players
+    - config: game configuration
+    - seed: seed for the map and the players' random number generators
+    - report_dir: if given, the game report is saved to this directory
+    - trace_file: if given, a Chrome trace of the game phases is saved to
+      this file, see ChromeTraceRecorder
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        config = dict(config, map_seed=seed)
+    if report_dir is None:
+        # Only the scores are needed
+        config = dict(config, score_only=True)
+
+    start_time = time.perf_counter()
+    game = SiteLocationGame(config,
+                            [import_player(p) for p in player_strs],
+                            attractiveness_allocation)
+    recorder = None
+    if trace_file is not None:
+        recorder = ChromeTraceRecorder()
+        game.add_hook(recorder)
+    player_ids = range(len(player_strs))
+    rounds = []
+    try:
+        for i in range(config["n_rounds"]):
+            round_start = time.perf_counter()
+            game.play_round()
+            stores = game.store_locations[-1]
+            rounds.append({
+                "round": game.current_round,
+                "funds": [_to_json(game.scores[-1].get(player_id))
+                          for player_id in player_ids],
+                "stores": [len(stores[player_id]) if player_id in stores
+                           else None for player_id in player_ids],
+                "elapsed_s": time.perf_counter() - round_start,
+            })
+    finally:
+        game.close()
+
+    winner = game.winner()
+    if report_dir is not None:
+        game.save_game_report(report_dir)
+    if recorder is not None:
+        recorder.save(trace_file)
+    return {
+        "seed": seed,
+        "players": list(player_strs),
+        "rounds": rounds,
+        "funds": [_to_json(game.scores[-1].get(player_id))
+                  for player_id in player_ids],
+        "winner": winner.player_id,
+        "timeouts": game.timeouts,
+        "elapsed_s": time.perf_counter() - start_time,
+    }
+
+
+def _to_json(score):
+    return None if score is None else float(score)
+
+
+def _init_simulation_worker(log_level):
+    log.setLevel(log_level)
+    # Forked workers start with copies of the parent's random state, reseed
+    # so unseeded games differ
+    random.seed()
+    np.random.seed()
+
+
+def _simulate_game_job(job):
+    return simulate_game(*job)
+
+
 def main():
 
     parser = argparse.ArgumentParser(description="Site Location Game")
@@ -608,22 +2846,74 @@ def main():
                         help="pass a series of <module>:<class> strings to specify the players in the game")
     parser.add_argument("--report",  type=str, default="game",
                         help="report game results to the given dir")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the map and the players' random number generators")
+    parser.add_argument("--map-cache", type=str, default=None,
+                        help="directory to cache seeded population maps in")
+    parser.add_argument("--games", type=int, default=1,
+                        help="number of games to play, game i is seeded with seed + i")
+    parser.add_argument("--no-report", action="store_true",
+                        help="don't save game reports")
+    parser.add_argument("--out", type=str, default=None,
+                        help="append one json line of results per game to the given file")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of games to play in parallel")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only log warnings and errors")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="save a Chrome trace of the timing of every game phase to the given json file")
     args = parser.parse_args()
 
     if args.players is None:
         parser.print_help()
         exit(-1)
-    
-    players = []
-    for player_str in args.players:
-        players.append(import_player(player_str))
 
-    game = SiteLocationGame(DEFAULT_CONFIGURATION,
-                            players,
-                            attractiveness_allocation)
-    game.play()
-    game.save_game_report(args.report)
+    # Fail early on players that can't be imported
+    for player_str in args.players:
+        import_player(player_str)
+
+    if args.quiet:
+        log.setLevel(logging.WARNING)
+
+    config = dict(DEFAULT_CONFIGURATION, map_cache_dir=args.map_cache)
+
+    # With several games, each gets its own report directory inside --report
+    # and its own numbered trace file
+    jobs = []
+    for i in range(args.games):
+        seed = None if args.seed is None else args.seed + i
+        report_dir = None
+        if not args.no_report:
+            report_dir = args.report
+            if args.games > 1:
+                report_dir = os.path.join(args.report, f"game-{i:04}")
+        trace_file = args.trace
+        if trace_file is not None and args.games > 1:
+            root, ext = os.path.splitext(args.trace)
+            trace_file = f"{root}-{i:04}{ext}"
+        jobs.append((args.players, config, seed, report_dir, trace_file))
+
+    pool = None
+    out = open(args.out, "a") if args.out is not None else None
+    try:
+        if args.workers == 1:
+            results = map(_simulate_game_job, jobs)
+        else:
+            pool = ProcessPoolExecutor(args.workers,
+                                       initializer=_init_simulation_worker,
+                                       initargs=(log.level,))
+            results = pool.map(_simulate_game_job, jobs)
+        for i, result in enumerate(results):
+            winner = result["players"][result["winner"]]
+            print(f"Game {i}: {winner} won in {result['elapsed_s']:.2f}s")
+            if out is not None:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not None:
+            out.close()
+        if pool is not None:
+            pool.shutdown()
 
 if __name__ == "__main__":
     main()
-
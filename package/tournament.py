@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import logging
+import argparse
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import List, Dict, Optional, Tuple
+
+from site_location import DEFAULT_CONFIGURATION, simulate_game, log
+
+
+PLAYERS_PER_GAME = 5
+FILL_IN_PLAYER = "example_players:RandomPlayer"
+# Number of times a round is replayed when fill in players win every game,
+# before the best scoring entries advance instead
+MAX_REPLAYS = 3
+
+
+def play_game(entries: List[str], seed: Optional[int] = None,
+              config: Dict = DEFAULT_CONFIGURATION) -> Tuple[int, List[float]]:
+    """Play a single game between the given entries, returns the index of the
+    winning entry and the final funds of every entry (None for entries that
+    failed to load)
+
+    entries - list of <module>:<class> strings
+    seed - seed for the map and the random number generators used by the
+           players
+    """
+    result = simulate_game(entries, config, seed)
+    return result["winner"], result["funds"]
+
+
+def _best_scoring_entries(results: List[Dict]) -> List[str]:
+    """ Returns the entry with the highest final score in each game result,
+    ignoring fill in players and entries that failed to load, and records it
+    as the entry advanced from the game
+    """
+    best = []
+    for result in results:
+        scores = [(score, entry) for entry, score
+                  in zip(result["entries"], result["scores"])
+                  if score is not None]
+        if scores:
+            result["advanced"] = max(scores, key=lambda item: item[0])[1]
+            best.append(result["advanced"])
+    return best
+
+
+def _init_worker(log_level):
+    log.setLevel(log_level)
+
+
+def run_tournament(entries: List[str],
+                   workers: Optional[int] = None,
+                   seed: Optional[int] = None,
+                   players_per_game: int = PLAYERS_PER_GAME,
+                   fill_in: str = FILL_IN_PLAYER,
+                   config: Dict = DEFAULT_CONFIGURATION,
+                   log_level=logging.WARNING) -> List[List[Dict]]:
+    """Run a tournament between the given entries, following the bracket
+    described in the README:
+
+    - entries are randomly assigned to games of players_per_game players,
+      games are filled with fill_in players if needed
+    - the winner of each game advances to the next round
+    - this is repeated until the remaining entries all belong to one team
+
+    If fill in players win every game of a round, the round is replayed (up
+    to MAX_REPLAYS times), then the best scoring entry of each game advances.
+    Entries that fail to load never advance this way, and a ValueError is
+    raised if no entry could be played at all.
+
+    Entries are <module>:<class> strings, and entries with the same string
+    belong to the same team. The games of each round are independent, so they
+    are played in parallel on a process pool of the given number of workers
+    (by default one per core).
+
+    Returns a list of rounds, each a list of game results with the entries,
+    number of fill in players, final scores, winner (None if a fill in
+    player won) and the entry that advanced from the game (None if none
+    did).
+    """
+    if not entries:
+        raise ValueError("A tournament needs at least one entry")
+
+    rng = random.Random(seed)
+    remaining = list(entries)
+    rounds: List[List[Dict]] = []
+    replays = 0
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(log_level,)) as pool:
+        while len(set(remaining)) > 1 or not rounds:
+            rng.shuffle(remaining)
+            games = [remaining[i:i+players_per_game]
+                     for i in range(0, len(remaining), players_per_game)]
+            log.info(f"Tournament round {len(rounds)+1}: "
+                     f"{len(remaining)} entries in {len(games)} games")
+
+            futures = []
+            for game_entries in games:
+                n_fill_ins = players_per_game - len(game_entries)
+                futures.append(pool.submit(play_game,
+                                           game_entries + [fill_in]*n_fill_ins,
+                                           rng.randrange(2**32),
+                                           config))
+
+            results = []
+            winners = []
+            for game_entries, future in zip(games, futures):
+                winner_index, final_scores = future.result()
+                winner = None
+                if winner_index < len(game_entries):
+                    winner = game_entries[winner_index]
+                    winners.append(winner)
+                results.append({
+                    "entries": game_entries,
+                    "fill_ins": players_per_game - len(game_entries),
+                    "scores": final_scores,
+                    "winner": winner,
+                    "advanced": winner,
+                })
+                log.info(f"Game {game_entries} won by {winner}")
+
+            if not winners and replays < MAX_REPLAYS:
+                replays += 1
+                log.warning("Every game was won by a fill in player, "
+                            "replaying the round")
+                continue
+            if not winners:
+                log.warning("Every game was won by a fill in player, "
+                            "advancing the best scoring entries")
+                winners = _best_scoring_entries(results)
+                if not winners:
+                    raise ValueError("None of the entries could be played")
+            replays = 0
+            rounds.append(results)
+            remaining = winners
+
+    log.info(f"Tournament winner: {remaining[0]}")
+    return rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Site Location Game tournament")
+    parser.add_argument("--entries", nargs="+", type=str, required=True,
+                        help="pass a series of <module>:<class> strings, one per entry (repeat a string to give a team several entries)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of games to play in parallel (default: number of cores)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the bracket draw and the games")
+    parser.add_argument("--players-per-game", type=int, default=PLAYERS_PER_GAME,
+                        help="number of players in each game")
+    parser.add_argument("--fill-in", type=str, default=FILL_IN_PLAYER,
+                        help="<module>:<class> string of the player used to fill incomplete games")
+    parser.add_argument("--map-cache", type=str, default=None,
+                        help="directory to cache the population maps of the games in")
+    parser.add_argument("--out", type=str, default=None,
+                        help="write the results of every game to the given json file")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log the progress of every game")
+    args = parser.parse_args()
+
+    log.setLevel(logging.INFO)
+    rounds = run_tournament(args.entries,
+                            workers=args.workers,
+                            seed=args.seed,
+                            players_per_game=args.players_per_game,
+                            fill_in=args.fill_in,
+                            config=dict(DEFAULT_CONFIGURATION,
+                                        map_cache_dir=args.map_cache),
+                            log_level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    for round_number, results in enumerate(rounds, 1):
+        print(f"Round {round_number}")
+        for result in results:
+            print(f"  {', '.join(result['entries'])} -> {result['advanced']}")
+    winner = next(result["advanced"] for result in rounds[-1]
+                  if result["advanced"])
+    print(f"Winner: {winner}")
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(rounds, f, indent=2)
+
+if __name__ == "__main__":
+    main()